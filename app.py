@@ -2,6 +2,7 @@ import streamlit as st
 import faiss
 import json
 import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 from groq import Groq
 from neo4j import GraphDatabase
@@ -18,9 +19,16 @@ NEO4J_USER = st.secrets["NEO4J_USERNAME"]
 NEO4J_PASSWORD = st.secrets["NEO4J_PASSWORD"]
 NEO4J_DATABASE = st.secrets.get("NEO4J_DATABASE", "neo4j")
 FAISS_INDEX_PATH = "db/medicine_embeddings.index"
+# Query-time recall/speed knobs for approximate indexes (see build_faiss_index.py)
+FAISS_NPROBE = 16
+FAISS_EF_SEARCH = 64
 METADATA_PATH = "db/metadata.json"
 
 EMBED_MODEL = "BAAI/bge-large-en-v1.5"
+# "onnx" runs the encoder through ONNX Runtime (needs `sentence-transformers[onnx]`)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+# Intra-op CPU threads for the encoder; beyond ~8 threads BGE-large stops scaling
+EMBED_THREADS = min(8, os.cpu_count() or 1)
 LLM_MODEL = "openai/gpt-oss-120b"       
 
 
@@ -30,7 +38,17 @@ LLM_MODEL = "openai/gpt-oss-120b"
 
 @st.cache_resource
 def load_faiss():
-    return faiss.read_index(FAISS_INDEX_PATH)
+    # Memory-map the index so the OS pages in only the vectors/lists actually
+    # searched; older FAISS builds only support this for IVF indexes.
+    try:
+        index = faiss.read_index(FAISS_INDEX_PATH, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        index = faiss.read_index(FAISS_INDEX_PATH)
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = FAISS_NPROBE
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = FAISS_EF_SEARCH
+    return index
 
 @st.cache_resource
 def load_metadata():
@@ -39,6 +57,9 @@ def load_metadata():
 
 @st.cache_resource
 def load_embedder():
+    torch.set_num_threads(EMBED_THREADS)
+    if EMBED_BACKEND == "onnx":
+        return SentenceTransformer(EMBED_MODEL, backend="onnx")
     return SentenceTransformer(EMBED_MODEL)
 
 @st.cache_resource
@@ -78,54 +99,88 @@ except Exception as e:
 #       GRAPH EXPANSION — FETCH RELATED NODES
 # ---------------------------------------------------------
 
-def get_graph_info(drug_name):
-    if neo4j_driver is None:
-        return {}
-    
-    query = """
-    MATCH (d:Drug {name: $name})-[r]->(n)
+GRAPH_INFO_CYPHER = """
+UNWIND $names AS name
+CALL {
+    WITH name
+    MATCH (d:Drug {name: name})-[r]->(n)
     RETURN type(r) AS relation, n.name AS value
     LIMIT 200
+}
+RETURN name, relation, value
+"""
+
+@st.cache_data(ttl=600, max_entries=4096)
+def _fetch_graph_info(names: tuple) -> dict:
+    # Failures raise instead of returning {}, so an outage is never cached
+    graph_info = {name: {} for name in names}
+    with neo4j_driver.session(database=NEO4J_DATABASE) as session:
+        # Group records straight off the cursor rather than materializing .data() dicts first
+        for record in session.run(GRAPH_INFO_CYPHER, names=list(names)):
+            graph_info[record["name"]].setdefault(record["relation"], []).append(record["value"])
+    return graph_info
+
+def get_graph_info_batch(names):
+    """Graph relations for every drug in `names` in one round-trip: {name: {relation: [values]}}.
+    Results are cached for 10 minutes per set of names, since the graph rarely
+    changes between searches.
     """
+    # FAISS can return the same medicine more than once (the metadata has
+    # duplicate names); each name is queried once so relations aren't repeated
+    names = list(dict.fromkeys(names))
+    if neo4j_driver is None or not names:
+        return {name: {} for name in names}
+
     try:
-        with neo4j_driver.session(database=NEO4J_DATABASE) as session:
-            result = session.run(query, name=drug_name).data()
+        return _fetch_graph_info(tuple(names))
     except Exception as e:
-        st.warning(f"Could not fetch graph data for {drug_name}: {str(e)}")
-        return {}
+        st.warning(f"Could not fetch graph data: {str(e)}")
+        return {name: {} for name in names}
 
-    graph_dict = {}
-    for row in result:
-        relation = row["relation"]
-        value = row["value"]
-        graph_dict.setdefault(relation, []).append(value)
-
-    return graph_dict
+def get_graph_info(drug_name):
+    return get_graph_info_batch([drug_name])[drug_name]
 
 
 # ---------------------------------------------------------
 #            SEMANTIC SEARCH (FAISS)
 # ---------------------------------------------------------
 
-def semantic_search(query, top_k=5):
-    query_emb = embedder.encode(query).astype("float32")
-
-    distances, indices = faiss_index.search(
-        np.array([query_emb]), top_k
+@st.cache_data(max_entries=1024, persist="disk")
+def embed_queries(queries: tuple, model_name: str, backend: str) -> bytes:
+    """Normalized float32 embeddings for `queries`, cached as raw bytes.
+    Embeddings are deterministic for a fixed model, so repeated searches skip
+    the encoder entirely (the disk cache also survives restarts). The model
+    name and backend are arguments only so they are part of the cache key.
+    """
+    embs = embedder.encode(
+        list(queries), batch_size=32, convert_to_numpy=True, normalize_embeddings=True
     )
+    return embs.astype("float32").tobytes()
+
+
+def semantic_search(queries, top_k=5):
+    """Returns the top_k metadata entries per query.
+    Accepts a single query string (returns one result list) or a list of
+    queries, which are embedded in one batch and searched with one FAISS call.
+    """
+    single = isinstance(queries, str)
+    if single:
+        queries = [queries]
+
+    query_embs = np.frombuffer(embed_queries(tuple(queries), EMBED_MODEL, EMBED_BACKEND), dtype="float32")
+    query_embs = query_embs.reshape(len(queries), faiss_index.d)
 
-    results = []
-    for idx in indices[0]:
-        results.append(metadata[idx])
-    return results
+    distances, indices = faiss_index.search(query_embs, top_k)
+
+    results = [[metadata[idx] for idx in row if idx >= 0] for row in indices]
+    return results[0] if single else results
 
 
 # ---------------------------------------------------------
 #            LLM ANSWER USING GROQ
 # ---------------------------------------------------------
 
-def answer_with_groq(query, retrieved, graph_info):
-    system_prompt = """
+SYSTEM_PROMPT = """
     You are a medical question answering assistant.
     You must:
     - Use the retrieved medicine information.
@@ -134,25 +189,27 @@ def answer_with_groq(query, retrieved, graph_info):
     - Respond using ONLY provided context.
     """
 
+def answer_with_groq(query, retrieved, graph_info):
     # Build context from FAISS metadata
-    text_block = ""
-    for item in retrieved:
-        text_block += f"""
+    text_block = "".join(
+        f"""
         Medicine: {item['name']}
         Uses: {item['uses']}
         Side Effects: {item['side_effects']}
         Manufacturer: {item['manufacturer']}
         """
+        for item in retrieved
+    )
 
     # Add graph info
-    graph_text = ""
+    graph_parts = []
     for medicine, relations in graph_info.items():
-        graph_text += f"\nGraph Data for {medicine}:\n"
-        for rel, vals in relations.items():
-            graph_text += f"{rel}: {', '.join(vals)}\n"
+        graph_parts.append(f"\nGraph Data for {medicine}:\n")
+        graph_parts.extend(f"{rel}: {', '.join(vals)}\n" for rel, vals in relations.items())
+    graph_text = "".join(graph_parts)
 
     full_prompt = f"""
-    {system_prompt}
+    {SYSTEM_PROMPT}
 
     User Query:
     {query}
@@ -166,13 +223,27 @@ def answer_with_groq(query, retrieved, graph_info):
     Final Answer:
     """
 
-    response = groq_client.chat.completions.create(
-        model=LLM_MODEL,
-        messages=[{"role": "user", "content": full_prompt}],
-        temperature=0.2,
-    )
+    try:
+        stream = groq_client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=[{"role": "user", "content": full_prompt}],
+            temperature=0.2,
+            stream=True,
+        )
+    except Exception as e:
+        return iter([f"Could not generate an answer: {str(e)}"])
+    return _stream_text(stream)
 
-    return response.choices[0].message.content
+
+def _stream_text(stream):
+    # Yield tokens as they arrive so the UI can render before generation ends;
+    # some chunks (e.g. the final usage chunk) carry no choices
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        yield f"\n\nThe answer was interrupted: {str(e)}"
 
 
 # ---------------------------------------------------------
@@ -197,15 +268,12 @@ if st.button("Search"):
 
         st.info("🧠 Expanding Knowledge Graph for all retrieved medicines...")
 
-        graph_dict = {}
-        for r in results:
-            graph_dict[r["name"]] = get_graph_info(r["name"])
+        graph_dict = get_graph_info_batch([r["name"] for r in results])
 
         st.write("### 🧬 Graph Relations Found")
         st.json(graph_dict)
 
         st.success("🤖 Generating LLM Answer...")
-        answer = answer_with_groq(query, results, graph_dict)
 
         st.write("### 🩺 Final Answer")
-        st.success(answer)
+        st.write_stream(answer_with_groq(query, results, graph_dict))
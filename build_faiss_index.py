@@ -0,0 +1,113 @@
+import json
+import argparse
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from ingest_graph import build_embedding_text, read_medicine_csv
+
+# Must match EMBED_MODEL / paths used by app.py
+EMBED_MODEL = "BAAI/bge-large-en-v1.5"
+FAISS_INDEX_PATH = "db/medicine_embeddings.index"
+METADATA_PATH = "db/metadata.json"
+
+# HNSW graph degree and build-time search depth
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+# IVF-PQ: coarse lists, sub-quantizers (must divide the dimension) and bits per code
+IVF_NLIST = 256
+PQ_M = 64
+PQ_NBITS = 8
+# FAISS wants roughly this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+METADATA_COLUMNS = {
+    'name': 'Medicine Name',
+    'composition': 'Composition',
+    'uses': 'Uses',
+    'side_effects': 'Side_effects',
+    'manufacturer': 'Manufacturer',
+}
+
+# -----------------------------------------------------------------------------
+# Index construction
+# -----------------------------------------------------------------------------
+
+def build_metadata(record: dict) -> dict:
+    """Lowercased retrieval payload stored alongside each vector (same row order as the index)."""
+    meta = {}
+    for key, column in METADATA_COLUMNS.items():
+        value = record.get(column)
+        meta[key] = str(value).strip().lower() if isinstance(value, str) else ""
+    return meta
+
+def build_index(xb: np.ndarray, index_type: str) -> faiss.Index:
+    """Inner-product index over L2-normalized vectors, i.e. cosine similarity (what BGE is trained for)."""
+    n, d = xb.shape
+    if index_type == 'flat':
+        index = faiss.IndexFlatIP(d)
+    elif index_type == 'hnsw':
+        # Graph search: ~log(N) hops per query, no training needed
+        index = faiss.IndexHNSWFlat(d, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == 'sq8':
+        # Exact scan over int8 codes: 4x less memory and scan bandwidth than float32
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(xb)
+    elif index_type == 'ivfpq':
+        # Coarse quantizer narrows the scan to `nprobe` lists; PQ codes shrink each vector to PQ_M bytes
+        nlist = max(1, min(IVF_NLIST, n // MIN_POINTS_PER_CENTROID))
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFPQ(quantizer, d, nlist, PQ_M, PQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+        index.train(xb)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+    index.add(xb)
+    return index
+
+def encode_texts(model: SentenceTransformer, texts: list[str], processes: int = 1) -> np.ndarray:
+    """L2-normalized float32 embeddings; `processes` > 1 spreads encoding over CPU worker processes."""
+    if processes > 1:
+        pool = model.start_multi_process_pool(['cpu'] * processes)
+        try:
+            xb = model.encode_multi_process(texts, pool, batch_size=64, normalize_embeddings=True)
+        finally:
+            model.stop_multi_process_pool(pool)
+    else:
+        xb = model.encode(
+            texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=True,
+        )
+    return xb.astype('float32')
+
+def build(csv_path: str, index_type: str = 'hnsw', limit: int | None = None,
+          index_path: str = FAISS_INDEX_PATH, metadata_path: str = METADATA_PATH, processes: int = 1):
+    df = read_medicine_csv(csv_path, limit)
+    records = df.to_dict('records')
+
+    model = SentenceTransformer(EMBED_MODEL)
+    xb = encode_texts(model, [build_embedding_text(r) for r in records], processes)
+
+    index = build_index(xb, index_type)
+    faiss.write_index(index, index_path)
+    with open(metadata_path, 'w') as f:
+        json.dump([build_metadata(r) for r in records], f)
+
+    print(f"Indexed {index.ntotal} medicines ({index_type}) -> {index_path}")
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the FAISS index and metadata used by app.py")
+    parser.add_argument('--csv', default='data/Medicine_Details.csv', help='Path to CSV file')
+    parser.add_argument('--index-type', choices=['flat', 'hnsw', 'sq8', 'ivfpq'], default='hnsw', help='FAISS index structure')
+    parser.add_argument('--limit', type=int, help='Limit rows for debugging')
+    parser.add_argument('--index-path', default=FAISS_INDEX_PATH, help='Output FAISS index file')
+    parser.add_argument('--metadata-path', default=METADATA_PATH, help='Output metadata JSON file')
+    parser.add_argument('--processes', type=int, default=1, help='CPU worker processes for embedding')
+    args = parser.parse_args()
+    build(args.csv, args.index_type, args.limit, args.index_path, args.metadata_path, args.processes)
+
+if __name__ == '__main__':
+    main()
@@ -1,67 +1,182 @@
 import os
 import streamlit as st
-from neo4j import GraphDatabase
-from langchain_community.graphs import Neo4jGraph
+from neo4j import GraphDatabase, READ_ACCESS, WRITE_ACCESS
 from dotenv import load_dotenv
 
 # Load environment variables from .env file for local development
 load_dotenv()
 
-class Neo4jConnection:
-    """
-    A class to manage the connection to a Neo4j database.
-    It uses the credentials sourced from Streamlit secrets or a local .env file.
-    """
-    def __init__(self):
-        # Prioritize Streamlit secrets, fall back to .env for local dev
-        if hasattr(st, 'secrets') and "NEO4J_URI" in st.secrets:
-            uri = st.secrets["NEO4J_URI"]
-            user = st.secrets["NEO4J_USER"]
-            password = st.secrets["NEO4J_PASSWORD"]
-            print("Connecting to Neo4j using Streamlit secrets.")
-        else:
-            uri = os.getenv("NEO4J_URI")
-            user = os.getenv("NEO4J_USER")
-            password = os.getenv("NEO4J_PASSWORD")
-            print("Connecting to Neo4j using local .env file.")
-
-        self._driver = GraphDatabase.driver(uri, auth=(user, password))
+# Shared driver for the whole process. The driver owns its own connection
+# pool, so every Neo4jConnection reuses warm Bolt connections instead of
+# paying the TCP + handshake cost on each Streamlit rerun.
+_DRIVER = None
+
+# Records pulled per Bolt round trip while streaming results
+FETCH_SIZE = 1000
+
+
+# Idempotent DDL, shared with ingest_graph and run once per driver here, so name
+# lookups use index seeks instead of label scans. `name_lower` /
+# `uses_text_lower` are denormalized lowercase copies kept by ingestion, so
+# queries never wrap indexed columns in toLower().
+SCHEMA_QUERIES = [
+    "CREATE CONSTRAINT medicine_name IF NOT EXISTS FOR (m:Medicine) REQUIRE m.name IS UNIQUE",
+    "CREATE CONSTRAINT ingredient_name IF NOT EXISTS FOR (i:ActiveIngredient) REQUIRE i.name IS UNIQUE",
+    "CREATE CONSTRAINT side_effect_name IF NOT EXISTS FOR (s:SideEffect) REQUIRE s.name IS UNIQUE",
+    "CREATE CONSTRAINT condition_name IF NOT EXISTS FOR (c:Condition) REQUIRE c.name IS UNIQUE",
+    "CREATE CONSTRAINT manufacturer_name IF NOT EXISTS FOR (mf:Manufacturer) REQUIRE mf.name IS UNIQUE",
+    "CREATE INDEX condition_name_lower IF NOT EXISTS FOR (c:Condition) ON (c.name_lower)",
+    "CREATE TEXT INDEX condition_name_lower_text IF NOT EXISTS FOR (c:Condition) ON (c.name_lower)",
+    "CREATE TEXT INDEX side_effect_name_lower_text IF NOT EXISTS FOR (s:SideEffect) ON (s.name_lower)",
+    "CREATE TEXT INDEX medicine_uses_text_lower_text IF NOT EXISTS FOR (m:Medicine) ON (m.uses_text_lower)",
+]
+
+# Fills the lowercase copies on nodes loaded before those properties existed.
+# Full label scans, so they are run by ingestion (`ingest_graph.py --migrate`
+# for an existing graph), never on app start.
+BACKFILL_QUERIES = [
+    "MATCH (c:Condition) WHERE c.name_lower IS NULL SET c.name_lower = toLower(c.name)",
+    "MATCH (s:SideEffect) WHERE s.name_lower IS NULL SET s.name_lower = toLower(s.name)",
+    "MATCH (m:Medicine) WHERE m.uses_text_lower IS NULL AND m.uses_text IS NOT NULL SET m.uses_text_lower = toLower(toString(m.uses_text))",
+]
+
+
+def ensure_schema(driver, db="neo4j"):
+    """Creates the indexes/constraints the query engine relies on (safe to re-run).
+    DDL only; data backfills are left to ingestion."""
+    for q in SCHEMA_QUERIES:
+        try:
+            with driver.session(database=db) as session:
+                session.run(q).consume()
+        except Exception as e:
+            print(f"Warning: schema statement failed ({q.split(' IF ')[0]}): {e}")
+
+
+def _get_credentials():
+    """Returns (uri, user, password) from Streamlit secrets or the .env file."""
+    # Prioritize Streamlit secrets, fall back to .env for local dev
+    if hasattr(st, 'secrets') and "NEO4J_URI" in st.secrets:
+        print("Connecting to Neo4j using Streamlit secrets.")
+        return st.secrets["NEO4J_URI"], st.secrets["NEO4J_USER"], st.secrets["NEO4J_PASSWORD"]
+    print("Connecting to Neo4j using local .env file.")
+    return os.getenv("NEO4J_URI"), os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD")
+
+
+def get_driver():
+    """Returns the process-wide Neo4j driver, creating it on first use."""
+    global _DRIVER
+    if _DRIVER is None:
+        uri, user, password = _get_credentials()
+        _DRIVER = GraphDatabase.driver(
+            uri,
+            auth=(user, password),
+            max_connection_pool_size=50,
+            connection_acquisition_timeout=30,
+        )
         try:
             # Verify connection
-            self._driver.verify_connectivity()
+            _DRIVER.verify_connectivity()
             print("Connected to Neo4j")
+            ensure_schema(_DRIVER)
         except Exception as e:
             print(f"Neo4j connection failed: {e}")
+    return _DRIVER
+
+
+class Neo4jConnection:
+    """
+    A class to manage the connection to a Neo4j database.
+    All instances share the module-level driver returned by `get_driver()`.
+    """
+    def __init__(self):
+        self._driver = get_driver()
 
     def close(self):
+        global _DRIVER
         if self._driver is not None:
             self._driver.close()
+            if _DRIVER is self._driver:
+                _DRIVER = None
+            self._driver = None
+
+    def warmup(self, db="neo4j"):
+        """Opens a pooled connection and runs a trivial query so the first real
+        request doesn't pay for TLS/Bolt setup."""
+        self.query("RETURN 1", db=db)
 
-    def query(self, query, parameters=None, db=None):
-        """Runs a Cypher query and returns the results."""
+    def query(self, query, parameters=None, db=None, write=False):
+        """Runs a Cypher query and returns the results.
+        Queries run as managed read transactions unless `write=True`, so in a
+        cluster they are routed to followers and retried on transient errors.
+        """
         assert self._driver is not None, "Driver not initialized!"
-        session = None
         response = None
+        access_mode = WRITE_ACCESS if write else READ_ACCESS
         try:
-            session = self._driver.session(database=db) if db is not None else self._driver.session()
-            response = list(session.run(query, parameters))
+            with self._driver.session(database=db, default_access_mode=access_mode, fetch_size=FETCH_SIZE) as session:
+                execute = session.execute_write if write else session.execute_read
+                response = execute(lambda tx: list(tx.run(query, parameters)))
         except Exception as e:
             print("Query failed:", e)
-        finally:
+        return response
+
+    def read_session(self, db=None):
+        """Opens a read session that several `query_data` calls can share.
+        The session connects lazily, so opening one that ends up unused is free.
+        """
+        assert self._driver is not None, "Driver not initialized!"
+        return self._driver.session(database=db, default_access_mode=READ_ACCESS, fetch_size=FETCH_SIZE)
+
+    def query_data(self, query, parameters=None, db=None, session=None):
+        """Read-only `query` that returns rows as plain dicts, or None on failure.
+        Rows are converted straight off the cursor inside the transaction, so no
+        intermediate list of Record objects is built. Runs on `session` when one
+        is given (see `read_session`), otherwise on a session of its own.
+        """
+        response = None
+        try:
             if session is not None:
-                session.close()
+                response = session.execute_read(lambda tx: tx.run(query, parameters).data())
+            else:
+                with self.read_session(db) as own_session:
+                    response = own_session.execute_read(lambda tx: tx.run(query, parameters).data())
+        except Exception as e:
+            print("Query failed:", e)
         return response
 
+    def query_stream(self, query, parameters=None, db=None):
+        """Yields records of a read-only query as they arrive from the server
+        (FETCH_SIZE per round trip) instead of materializing the whole result.
+        Stopping iteration early closes the session and discards the rest.
+        Runs as an auto-commit transaction, so it is not retried like `query`.
+        """
+        assert self._driver is not None, "Driver not initialized!"
+        try:
+            with self._driver.session(database=db, default_access_mode=READ_ACCESS, fetch_size=FETCH_SIZE) as session:
+                yield from session.run(query, parameters)
+        except Exception as e:
+            print("Streaming query failed:", e)
+
+
+@st.cache_resource
+def get_langchain_graph():
+    """
+    Returns the LangChain Neo4jGraph used for LLM Cypher generation.
+    Built (and its schema refreshed) once per process on first use, instead of
+    on every import / Streamlit rerun.
+    """
+    from langchain_community.graphs import Neo4jGraph
 
-graph = Neo4jGraph(
-    url=st.secrets["NEO4J_URI"], 
-    username=st.secrets["NEO4J_USER"], 
-    password=st.secrets["NEO4J_PASSWORD"]
-)
+    uri, user, password = _get_credentials()
+    # The constructor would introspect the schema itself; skip that so the
+    # (APOC-backed, multi-query) introspection runs exactly once, below
+    graph = Neo4jGraph(url=uri, username=user, password=password, refresh_schema=False)
 
-# Refresh schema information for the LangChain graph object
-# This helps the LLM generate more accurate Cypher queries
-try:
-    graph.refresh_schema()
-except Exception as e:
-    print(f"Warning: Could not refresh graph schema. The LLM might generate less accurate queries. Error: {e}")
+    # Refresh schema information for the LangChain graph object
+    # This helps the LLM generate more accurate Cypher queries. The result is
+    # kept on the cached object (graph.schema) and reused by every prompt.
+    try:
+        graph.refresh_schema()
+    except Exception as e:
+        print(f"Warning: Could not refresh graph schema. The LLM might generate less accurate queries. Error: {e}")
+    return graph
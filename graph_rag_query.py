@@ -1,135 +1,512 @@
 import os
+import re
+import time
+import queue
+import difflib
+import threading
+from bisect import bisect_left
+from concurrent.futures import Future
+from functools import lru_cache
+import numpy as np
+import torch
 from graph_db import Neo4jConnection
 from sentence_transformers import SentenceTransformer
 import streamlit as st
 
 # --- CONFIGURATION ---
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# "torch", "onnx" or "openvino" (the latter two need `sentence-transformers[onnx]` / `[openvino]`)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Pre-exported ONNX/OpenVINO graph to load instead of the plain export, e.g.
+# "onnx/model_O2.onnx" (fused, graph-optimized) or "onnx/model_qint8_avx512_vnni.onnx"
+# (dynamic int8); all-MiniLM-L6-v2 ships both on the Hub
+EMBEDDING_MODEL_FILE = os.getenv("EMBEDDING_MODEL_FILE")
+# Intra-op threads per process; set to 1 when running several app workers per host (0 = torch default)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
 VECTOR_INDEX_NAME = os.getenv("VECTOR_INDEX_NAME", "medicine_embeddings")
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "300"))
+EMBEDDING_CACHE_SIZE = 4096
+# HNSW candidates explored per vector query (see VECTOR_SEARCH_CYPHER); the
+# RAG anchor is a single pick, so it searches wider for the true best match
+VECTOR_SEARCH_EF = 40
+RAG_VECTOR_EF = 100
+# Queries are short; a tight token cap avoids padding every batch out to the model max (256)
+EMBEDDING_MAX_SEQ_LENGTH = int(os.getenv("EMBEDDING_MAX_SEQ_LENGTH", "64"))
+# Micro-batching window for concurrent single-text embeddings
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_BATCH_WAIT_MS = 10
+
+# -----------------------------------------------------------------------------
+# Cypher queries
+# Kept as module constants with $parameters only, so the query text is
+# byte-identical on every call and Neo4j's plan cache is always hit.
+# -----------------------------------------------------------------------------
+
+DIRECT_LOOKUP_CYPHER = """
+MATCH (m:Medicine {name: $med_name})
+CALL { WITH m OPTIONAL MATCH (m)-[:TREATS]->(c:Condition) RETURN collect(DISTINCT c.name) AS uses }
+CALL { WITH m OPTIONAL MATCH (m)-[:HAS_SIDE_EFFECT]->(s:SideEffect) RETURN collect(DISTINCT s.name) AS side_effects }
+RETURN m.name AS medicine, uses, side_effects
+"""
+
+# Condition matches are tiered: exact condition name (a RANGE index seek), then
+# partial condition name, then free-text uses. A tier's CONTAINS scan only runs
+# when the tiers above it came up short, so common exact hits never scan.
+# Several conditions are resolved in the same statement via UNWIND, each
+# capped at 25 medicines, best tier first. The CONTAINS tiers are pinned to
+# their TEXT indexes, as the search string is only known per row.
+REVERSE_LOOKUP_CYPHER = """
+UNWIND $cond_names AS q
+CALL {
+  WITH q
+  MATCH (m:Medicine)-[:TREATS]->(:Condition {name_lower: q})
+  WITH DISTINCT m.name AS name ORDER BY name
+  RETURN collect(name) AS exact
+}
+CALL {
+  WITH q, exact
+  WITH q, exact WHERE size(exact) < 25
+  MATCH (m:Medicine)-[:TREATS]->(c:Condition)
+  USING TEXT INDEX c:Condition(name_lower)
+  WHERE c.name_lower CONTAINS q AND NOT m.name IN exact
+  WITH DISTINCT m.name AS name ORDER BY name
+  RETURN collect(name) AS partial
+}
+CALL {
+  WITH q, exact, partial
+  WITH q, exact, partial WHERE size(exact) + size(partial) < 25
+  MATCH (m:Medicine)
+  USING TEXT INDEX m:Medicine(uses_text_lower)
+  WHERE m.uses_text_lower CONTAINS q AND NOT m.name IN exact AND NOT m.name IN partial
+  WITH DISTINCT m.name AS name ORDER BY name
+  RETURN collect(name) AS in_uses
+}
+RETURN q AS condition, (exact + partial + in_uses)[..25] AS medicines
+"""
+
+# One row per other medicine (its shared ingredients joined), so a medicine
+# sharing several ingredients is neither sent nor rendered more than once.
+CHECK_INTERACTIONS_CYPHER = """
+MATCH (m1:Medicine {name: $med_name})-[:CONTAINS_INGREDIENT]->(i:ActiveIngredient)
+MATCH (m2:Medicine)-[:CONTAINS_INGREDIENT]->(i)
+WHERE m1 <> m2
+WITH m2, collect(DISTINCT i.name) AS shared
+RETURN m2.name AS other_medicine,
+       reduce(acc = head(shared), ing IN tail(shared) | acc + ', ' + ing) AS shared_ingredient
+LIMIT 10
+"""
+
+# queryNodes has no efSearch option: Lucene's HNSW beam is the requested
+# neighbour count. Both vector queries therefore ask for $ef candidates (the
+# effective beam width) and keep only the top $k, trading a little latency
+# for recall.
+VECTOR_SEARCH_CYPHER = """
+CALL db.index.vector.queryNodes($index_name, $ef, $embedding)
+YIELD node AS medicine, score
+RETURN medicine.name, score
+ORDER BY score DESC
+LIMIT $k
+"""
+
+# Shared tail of the RAG queries: expands an already-bound `m` into its context.
+# Each OPTIONAL MATCH leg is collected in its own subquery so the row count
+# stays bounded by m's neighbours instead of the product of all legs.
+_RAG_CONTEXT_RETURN = """
+CALL { WITH m OPTIONAL MATCH (m)-[:MANUFACTURED_BY]->(mf:Manufacturer) RETURN mf.name AS manufacturer LIMIT 1 }
+CALL { WITH m OPTIONAL MATCH (m)-[:TREATS]->(c:Condition) RETURN collect(DISTINCT c.name) AS uses }
+CALL { WITH m OPTIONAL MATCH (m)-[:HAS_SIDE_EFFECT]->(s:SideEffect) RETURN collect(DISTINCT s.name) AS side_effects }
+CALL { WITH m OPTIONAL MATCH (m)-[:CONTAINS_INGREDIENT]->(i:ActiveIngredient) RETURN collect(DISTINCT i.name) AS ingredients }
+RETURN m.name AS medicine,
+       m.composition AS composition,
+       m.uses_text AS uses_text,
+       m.side_effects_text AS side_effects_text,
+       m.image_url AS image_url,
+       m.excellent_review_pct AS excellent_review_pct,
+       m.average_review_pct AS average_review_pct,
+       m.poor_review_pct AS poor_review_pct,
+       manufacturer, uses, side_effects, ingredients
+"""
+
+# Anchor selection and context fetch are fused, so each RAG path is one round trip.
+# Condition path: same tiering as REVERSE_LOOKUP_CYPHER, then the best-reviewed
+# medicine from the strongest non-empty tier.
+RAG_CONDITION_CONTEXT_CYPHER = """
+WITH $cond AS q
+CALL {
+  WITH q
+  MATCH (m:Medicine)-[:TREATS]->(:Condition {name_lower: q})
+  RETURN collect(DISTINCT m) AS exact
+}
+CALL {
+  WITH q, exact
+  WITH q, exact WHERE size(exact) = 0
+  MATCH (m:Medicine)-[:TREATS]->(c:Condition)
+  USING TEXT INDEX c:Condition(name_lower)
+  WHERE c.name_lower CONTAINS q
+  RETURN collect(DISTINCT m) AS partial
+}
+CALL {
+  WITH q, exact, partial
+  WITH q, exact, partial WHERE size(exact) + size(partial) = 0
+  MATCH (m:Medicine)
+  USING TEXT INDEX m:Medicine(uses_text_lower)
+  WHERE m.uses_text_lower CONTAINS q
+  RETURN collect(DISTINCT m) AS in_uses
+}
+UNWIND exact + partial + in_uses AS m
+WITH m
+ORDER BY coalesce(m.excellent_review_pct,0) DESC, coalesce(m.average_review_pct,0) DESC
+LIMIT 1
+""" + _RAG_CONTEXT_RETURN
+
+# Name path: the query spelled out a medicine name.
+RAG_NAME_CONTEXT_CYPHER = """
+MATCH (m:Medicine {name: $name})
+""" + _RAG_CONTEXT_RETURN
+
+# Vector path: nearest medicine to the question embedding.
+RAG_VECTOR_CONTEXT_CYPHER = """
+CALL db.index.vector.queryNodes($index_name, $ef, $embedding)
+YIELD node AS m, score
+WITH m
+ORDER BY score DESC
+LIMIT 1
+""" + _RAG_CONTEXT_RETURN
+
+VISUALIZATION_CYPHER = """
+MATCH (m:Medicine {name: $med_name})-[r]-(n)
+WITH m,
+     collect(DISTINCT {id: elementId(n), name: coalesce(n.name, 'N/A'), label: labels(n)[0]}) AS neighbors,
+     collect({target: elementId(n), rel: type(r)}) AS rels
+RETURN elementId(m) AS id,
+       m.name AS name,
+       labels(m)[0] AS label,
+       neighbors,
+       rels
+"""
+
+MEDICINE_NAMES_CYPHER = """
+MATCH (m:Medicine)
+RETURN m.name AS name
+"""
+
+MEDICINE_CARDS_CYPHER = """
+UNWIND $names AS med_name
+MATCH (m:Medicine {name: med_name})
+CALL { WITH m OPTIONAL MATCH (m)-[:MANUFACTURED_BY]->(mf:Manufacturer) RETURN mf.name AS manufacturer LIMIT 1 }
+CALL { WITH m OPTIONAL MATCH (m)-[:TREATS]->(c:Condition) RETURN collect(DISTINCT c.name) AS conditions }
+CALL { WITH m OPTIONAL MATCH (m)-[:HAS_SIDE_EFFECT]->(s:SideEffect) RETURN collect(DISTINCT s.name) AS side_effects }
+CALL { WITH m OPTIONAL MATCH (m)-[:CONTAINS_INGREDIENT]->(i:ActiveIngredient) RETURN collect(DISTINCT i.name) AS ingredients }
+RETURN m.name as name, m.image_url AS image_url, m.composition AS composition,
+       m.uses_text AS uses_text, m.side_effects_text AS side_effects_text,
+       conditions, side_effects, ingredients, manufacturer,
+       m.excellent_review_pct AS excellent_review_pct,
+       m.average_review_pct AS average_review_pct,
+       m.poor_review_pct AS poor_review_pct
+"""
+
+# The hint pins each symptom's CONTAINS to the name_lower TEXT index (a Lucene
+# seek per symptom); the planner otherwise may label-scan every SideEffect,
+# since the search string is only known per UNWIND row.
+SYMPTOM_TO_MEDICINES_CYPHER = """
+UNWIND $symptoms AS sym
+MATCH (s:SideEffect)
+USING TEXT INDEX s:SideEffect(name_lower)
+WHERE s.name_lower CONTAINS sym
+MATCH (m:Medicine)-[:HAS_SIDE_EFFECT]->(s)
+RETURN s.name AS matched_symptom, collect(DISTINCT m.name) AS medicines
+LIMIT $limit
+"""
+
+# All medicines in one statement; UNWIND keeps the input order.
+JUSTIFY_PRESCRIPTION_CYPHER = """
+UNWIND $meds AS med
+MATCH (m:Medicine {name: med})
+CALL { WITH m OPTIONAL MATCH (m)-[:TREATS]->(c:Condition) RETURN collect(DISTINCT c.name) AS conditions }
+CALL { WITH m OPTIONAL MATCH (m)-[:HAS_SIDE_EFFECT]->(s:SideEffect) RETURN collect(DISTINCT s.name) AS side_effects }
+CALL { WITH m OPTIONAL MATCH (m)-[:CONTAINS_INGREDIENT]->(i:ActiveIngredient) RETURN collect(DISTINCT i.name) AS ingredients }
+RETURN m.name AS medicine,
+       m.composition AS composition,
+       conditions, ingredients, side_effects
+"""
+
+INTERACTION_CONFLICTS_CYPHER = """
+MATCH (m:Medicine {name: $medicine})-[:INTERACTS_WITH]-(o:Medicine)
+RETURN DISTINCT o.name AS interacting_medicine
+LIMIT 25
+"""
+
+
+# Splits comma/newline separated user input ("fever, nausea\nrash")
+_TERM_SPLIT = re.compile(r"\s*[,\n]\s*")
+
+# Condition-phrase heuristic, compiled once at import. One match captures both
+# candidate phrases: `for_cond` is the text after the first " for " up to the
+# first ?.,;: and `med_cond` is everything before a trailing " medicine".
+# Both groups sit in optional lookaheads, so the match always succeeds.
+_CONDITION_PHRASE_RE = re.compile(
+    r"(?=(?:.*? for (?P<for_cond>[^?.,;:]*))?)"
+    r"(?=(?:(?P<med_cond>.+) medicine$)?)",
+    re.S,
+)
+_LEADING_ARTICLES_RE = re.compile(r"^(?:a )?(?:an )?(?:the )?")
+# Sentence punctuation that can abut a medicine name in a question
+_NAME_PUNCT_RE = re.compile(r"[?!,;:]")
+
+# Common single-word conditions, found as whole tokens (delimited by whitespace
+# or '?') with one scan of the query instead of a per-token set lookup loop.
+COMMON_CONDITIONS = ("fever", "cold", "cough", "pain", "migraine", "diarrhea", "diarrhoea")
+_COMMON_CONDITION_RE = re.compile(r"(?<![^\s?])(" + "|".join(COMMON_CONDITIONS) + r")(?![^\s?])")
+
+
+def _normalize_terms(terms: list[str] | str) -> list[str]:
+    """Lowercases and strips user-entered terms, dropping empties.
+    Accepts a list or a single comma/newline separated string.
+    """
+    if isinstance(terms, str):
+        terms = _TERM_SPLIT.split(terms)
+    return [t.strip().lower() for t in terms if t and t.strip()]
+
+
+def _normalize_phrase(text: str) -> str:
+    """Lowercases and collapses whitespace so equivalent phrasings share one cache key."""
+    return " ".join(text.lower().split())
 
 
 @st.cache_resource
 def get_embedding_model():
     """Initializes and returns the SentenceTransformer model."""
-    return SentenceTransformer(EMBEDDING_MODEL)
+    if EMBEDDING_THREADS:
+        torch.set_num_threads(EMBEDDING_THREADS)
+    if EMBEDDING_BACKEND == "torch":
+        model = SentenceTransformer(EMBEDDING_MODEL)
+    else:
+        model_kwargs = {"file_name": EMBEDDING_MODEL_FILE} if EMBEDDING_MODEL_FILE else {}
+        if EMBEDDING_BACKEND == "onnx":
+            model_kwargs["provider"] = "CPUExecutionProvider"
+        model = SentenceTransformer(EMBEDDING_MODEL, backend=EMBEDDING_BACKEND, model_kwargs=model_kwargs)
+    model.max_seq_length = EMBEDDING_MAX_SEQ_LENGTH
+    # One throwaway batch pays for lazy allocations, kernel selection and the
+    # tokenizer warm-up here, at startup, instead of on the first user query
+    model.encode(["warmup"] * 4, batch_size=4)
+    return model
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding requests (one per Streamlit
+    session thread) into one batched encode call. A background thread takes
+    the first queued text, gathers whatever else arrives within `max_wait_ms`
+    (up to `max_batch` texts), encodes them together and resolves each
+    caller's Future with its own row.
+    """
+
+    def __init__(self, model: SentenceTransformer, max_batch: int = EMBEDDING_BATCH_SIZE,
+                 max_wait_ms: int = EMBEDDING_BATCH_WAIT_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="embedding-batcher", daemon=True).start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _next_batch(self) -> list[tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self.model.encode(
+                    texts, batch_size=len(texts), convert_to_numpy=True, normalize_embeddings=True
+                )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+
+@st.cache_resource
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """One batcher (and worker thread) per process, shared by all sessions."""
+    return EmbeddingBatcher(get_embedding_model())
+
+
+@lru_cache(maxsize=EMBEDDING_CACHE_SIZE)
+def _cached_embedding(text: str) -> np.ndarray:
+    """Embeds one text, memoized; misses go through the shared micro-batcher.
+    Kept as a read-only float32 array (1.5 KB) rather than a tuple of Python
+    floats (~12 KB), detached from the batch array it was sliced from, so
+    cached values are compact and can't be mutated.
+    """
+    embedding = get_embedding_batcher().submit(text).result().astype(np.float32)
+    embedding.flags.writeable = False
+    return embedding
+
+
+class NameResolver:
+    """
+    Resolves user-typed names to canonical node names without a database hit:
+    exact (case/space-insensitive), then the first prefix match found by binary
+    search over the sorted keys, then the closest fuzzy match for typos.
+    """
+
+    def __init__(self, names: list[str], cutoff: float = 0.8):
+        self.cutoff = cutoff
+        self._by_key = {_normalize_phrase(n): n for n in names if n}
+        self._keys = sorted(self._by_key)
+        self._max_words = max((len(k.split()) for k in self._keys), default=0)
+
+    def resolve(self, name: str) -> str | None:
+        key = _normalize_phrase(name or "")
+        if not key:
+            return None
+        if key in self._by_key:
+            return self._by_key[key]
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i].startswith(key):
+            return self._by_key[self._keys[i]]
+        close = difflib.get_close_matches(key, self._keys, n=1, cutoff=self.cutoff)
+        return self._by_key[close[0]] if close else None
+
+    def find_in(self, text: str) -> str | None:
+        """Longest name (of two or more words) spelled out in free text, or None.
+        Every word n-gram up to the longest name is one dict lookup, so a scan
+        costs O(words x longest name) however many names there are. Single
+        words are skipped so a plain term like 'cold' never reads as a name.
+        """
+        words = _normalize_phrase(_NAME_PUNCT_RE.sub(" ", text or "")).split()
+        for n in range(min(self._max_words, len(words)), 1, -1):
+            for i in range(len(words) - n + 1):
+                name = self._by_key.get(" ".join(words[i:i + n]))
+                if name:
+                    return name
+        return None
+
+
+class _QueryFailed(Exception):
+    """Raised inside the cached reader so failed queries are not memoized."""
+
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, max_entries=1024, show_spinner=False)
+def _cached_read(_db: Neo4jConnection, query: str, parameters: dict, db: str, _session=None) -> list[dict]:
+    """Runs a read-only Cypher query and memoizes its rows as plain dicts.
+    Keyed on the query text and parameters; `_db` and `_session` are excluded from hashing.
+    """
+    result = _db.query_data(query, parameters=parameters, db=db, session=_session)
+    if result is None:
+        raise _QueryFailed(query)
+    return result
 
 
 class GraphQueryEngine:
     """Handles queries to the Neo4j database."""
 
-    def __init__(self):
+    def __init__(self, search_ef: int = VECTOR_SEARCH_EF, rag_ef: int = RAG_VECTOR_EF):
+        self.search_ef = search_ef
+        self.rag_ef = rag_ef
         self.db = Neo4jConnection()
         self.model = get_embedding_model()
+        self._uncased = getattr(self.model.tokenizer, "do_lower_case", False)
+        self._medicine_names = None
         print("Embedding model loaded")
 
     # ----------------------------
     # Basic helpers
     # ----------------------------
     def get_embedding(self, text: str) -> list[float]:
-        """Generates an embedding for a given text."""
-        return self.model.encode(text).tolist()
+        """Generates an embedding for a given text.
+        Cached per normalized text: whitespace is always collapsed, and case is
+        folded too when the tokenizer is uncased (as MiniLM's is), since those
+        variants tokenize identically and so embed identically.
+        """
+        return self._query_vector(text).tolist()
+
+    def _query_vector(self, text: str) -> np.ndarray:
+        """The cached float32 embedding itself, passed as-is to vector queries:
+        the driver packs ndarrays natively and the query cache hashes it as one
+        buffer instead of walking 384 Python floats.
+        """
+        key = _normalize_phrase(text) if self._uncased else " ".join(text.split())
+        return _cached_embedding(key)
+
+    def _read(self, query: str, parameters: dict | None = None, session=None) -> list[dict] | None:
+        """Runs a read-only query through the TTL cache; None if the query failed.
+        A cache miss runs on `session` when one is given.
+        """
+        try:
+            return _cached_read(self.db, query, parameters or {}, "neo4j", _session=session)
+        except _QueryFailed:
+            return None
+
+    @staticmethod
+    def invalidate_cache():
+        """Drops all memoized query results, e.g. after the graph has been re-ingested."""
+        _cached_read.clear()
 
     # ----------------------------
     # Core queries
     # ----------------------------
     def direct_lookup(self, medicine_name: str) -> list[dict]:
         """Finds uses and side effects for a specific medicine."""
-        query = """
-            MATCH (m:Medicine {name: $med_name})
-            OPTIONAL MATCH (m)-[:TREATS]->(c:Condition)
-            OPTIONAL MATCH (m)-[:HAS_SIDE_EFFECT]->(s:SideEffect)
-            RETURN m.name AS medicine,
-                   collect(DISTINCT c.name) AS uses,
-                   collect(DISTINCT s.name) AS side_effects
-        """
-        result = self.db.query(query, parameters={"med_name": medicine_name}, db="neo4j")
+        result = self._read(DIRECT_LOOKUP_CYPHER, parameters={"med_name": medicine_name})
         return result
 
     def reverse_lookup(self, condition: str) -> list[str]:
         """Finds medicines that treat a specific condition (case-insensitive).
         Falls back to searching uses_text if Condition nodes are missing.
         """
-        query = """
-            CALL {
-              WITH $cond_name AS q
-              MATCH (m:Medicine)-[:TREATS]->(c:Condition)
-              WHERE toLower(c.name) = toLower(q) OR toLower(c.name) CONTAINS toLower(q)
-              RETURN DISTINCT m.name AS medicine
-              UNION
-              WITH $cond_name AS q
-              MATCH (m:Medicine)
-              WHERE m.uses_text IS NOT NULL AND toLower(m.uses_text) CONTAINS toLower(q)
-              RETURN DISTINCT m.name AS medicine
-            }
-            RETURN medicine
-            LIMIT 25
-        """
-        result = self.db.query(query, parameters={"cond_name": condition}, db="neo4j")
-        return [record["medicine"] for record in result] if result else []
+        return next(iter(self.reverse_lookup_many([condition]).values()), [])
+
+    def reverse_lookup_many(self, conditions: list[str]) -> dict[str, list[str]]:
+        """Reverse lookup for several conditions in one round trip, keyed by normalized condition."""
+        conditions = list(dict.fromkeys(c for c in map(_normalize_phrase, conditions) if c))
+        if not conditions:
+            return {}
+        result = self._read(REVERSE_LOOKUP_CYPHER, parameters={"cond_names": conditions})
+        found = {record["condition"]: record["medicines"] for record in result} if result else {}
+        return {cond: found.get(cond, []) for cond in conditions}
 
     def check_interactions(self, medicine_name: str) -> list[dict]:
         """Finds other medicines that share the same active ingredient."""
-        query = """
-            MATCH (m1:Medicine {name: $med_name})-[:CONTAINS_INGREDIENT]->(i:ActiveIngredient)
-            MATCH (m2:Medicine)-[:CONTAINS_INGREDIENT]->(i)
-            WHERE m1 <> m2
-            RETURN m2.name AS other_medicine, i.name AS shared_ingredient
-            LIMIT 10
-        """
-        result = self.db.query(query, parameters={"med_name": medicine_name}, db="neo4j")
+        result = self._read(CHECK_INTERACTIONS_CYPHER, parameters={"med_name": medicine_name})
         return result
 
-    def vector_similarity_search(self, query: str) -> list[dict]:
-        """Uses embeddings to find semantically similar medicines."""
-        query_embedding = self.get_embedding(query)
-        cypher_query = """
-            CALL db.index.vector.queryNodes($index_name, 5, $embedding)
-            YIELD node AS medicine, score
-            RETURN medicine.name, score
-        """
-        result = self.db.query(
-            cypher_query,
-            parameters={"index_name": VECTOR_INDEX_NAME, "embedding": query_embedding},
-            db="neo4j",
+    def vector_similarity_search(self, query: str, top_k: int = 5) -> list[dict]:
+        """Uses embeddings to find the `top_k` most semantically similar medicines."""
+        query_embedding = self._query_vector(query)
+        result = self._read(
+            VECTOR_SEARCH_CYPHER,
+            parameters={"index_name": VECTOR_INDEX_NAME, "embedding": query_embedding,
+                        "k": top_k, "ef": max(top_k, self.search_ef)}
         )
         return result
 
     
-    def _best_medicine_for_condition(self, condition: str) -> str | None:
-        """Pick a representative medicine for a condition using simple heuristics.
-        Prefers higher excellent review %, then average; falls back to any match.
-        """
-        if not condition:
+    def _condition_context(self, condition: str, session=None) -> dict | None:
+        """RAG context of the best-reviewed medicine for a condition, or None."""
+        cond = _normalize_phrase(condition or "")
+        if not cond:
             return None
-        cypher = """
-        CALL {
-          WITH $cond AS q
-          MATCH (m:Medicine)-[:TREATS]->(c:Condition)
-          WHERE toLower(c.name) = toLower(q) OR toLower(c.name) CONTAINS toLower(q)
-          RETURN m
-          UNION
-          WITH $cond AS q
-          MATCH (m:Medicine)
-          WHERE m.uses_text IS NOT NULL AND toLower(m.uses_text) CONTAINS toLower(q)
-          RETURN m
-        }
-        RETURN m.name AS name,
-               coalesce(m.excellent_review_pct,0) AS excellent,
-               coalesce(m.average_review_pct,0) AS average
-        ORDER BY excellent DESC, average DESC
-        LIMIT 1
-        """
-        res = self.db.query(cypher, {"cond": condition}, db="neo4j")
-        if res and len(res) > 0:
-            try:
-                return res[0]["name"]
-            except Exception:
-                rec = res[0]
-                if hasattr(rec, "data"):
-                    return rec.data().get("name")
-                if hasattr(rec, "keys"):
-                    return rec["name"]
-        return None
+        res = self._read(RAG_CONDITION_CONTEXT_CYPHER, {"cond": cond}, session=session)
+        return res[0] if res else None
 
     def _extract_condition_from_query(self, user_query: str) -> str | None:
         """Very light heuristic to extract a condition phrase like 'fever' from queries.
@@ -138,155 +515,113 @@ class GraphQueryEngine:
         if not user_query:
             return None
         q = user_query.strip().lower()
+        phrase = _CONDITION_PHRASE_RE.match(q)
         # Rule 1: look for ' for <cond>' pattern
-        if " for " in q:
-            tail = q.split(" for ", 1)[1]
-            for sep in ["?", ".", ",", ";", ":"]:
-                tail = tail.split(sep)[0]
-            cond = tail.strip()
-            for lead in ["a ", "an ", "the "]:
-                if cond.startswith(lead):
-                    cond = cond[len(lead):]
-            cond = cond.strip()
+        if phrase["for_cond"] is not None:
+            cond = _LEADING_ARTICLES_RE.sub("", phrase["for_cond"].strip(), count=1).strip()
             if cond:
                 return cond
         # Rule 2: '<cond> medicine' pattern
-        if q.endswith(" medicine"):
-            cond = q.rsplit(" ", 1)[0].strip()
-            return cond or None
+        if phrase["med_cond"] is not None:
+            return phrase["med_cond"].strip() or None
         # Rule 3: common single-word conditions
-        common = {"fever", "cold", "cough", "pain", "migraine", "diarrhea", "diarrhoea"}
-        tokens = [t for t in q.replace("?", " ").split() if t.isalpha()]
-        for t in tokens:
-            if t in common:
-                return t
-        return None
+        match = _COMMON_CONDITION_RE.search(q)
+        return match.group(1) if match else None
+
+    def _vector_context(self, user_query: str, session=None) -> dict | None:
+        """RAG context of the medicine nearest to the query embedding, or None."""
+        query_embedding = self._query_vector(user_query)
+        res = self._read(
+            RAG_VECTOR_CONTEXT_CYPHER,
+            parameters={"index_name": VECTOR_INDEX_NAME, "embedding": query_embedding, "ef": self.rag_ef},
+            session=session,
+        )
+        return res[0] if res else None
 
     def retrieve_context_for_rag(self, user_query: str) -> dict | None:
         """Retrieves the context from the graph for the RAG pipeline.
-        Strategy: Try condition-first (e.g., 'medicine for fever') -> choose a best medicine.
+        Strategy: a medicine named in the query is used directly (no embedding).
+        Otherwise try condition-first (e.g., 'medicine for fever') -> choose a best medicine.
         Fall back to vector retrieval if condition-based selection fails.
+        Each path selects its medicine and fetches its context in one query, and
+        the paths tried for one question share a single session.
         """
-        top_medicine_name: str | None = None
-
-        # A) Condition-first heuristic
-        cond = self._extract_condition_from_query(user_query)
-        if cond:
-            best = self._best_medicine_for_condition(cond)
-            if best:
-                top_medicine_name = best
-
-        # B) Vector fallback if no clear condition-based anchor
-        if not top_medicine_name:
-            query_embedding = self.get_embedding(user_query)
-            retrieval_query = """
-                CALL db.index.vector.queryNodes($index_name, 1, $embedding)
-                YIELD node AS medicine
-                RETURN medicine.name AS med_name
-            """
-            retrieval_result = self.db.query(
-                retrieval_query,
-                parameters={"index_name": VECTOR_INDEX_NAME, "embedding": query_embedding},
-                db="neo4j",
-            )
-            if not retrieval_result:
-                return None
-            top_medicine_name = retrieval_result[0]["med_name"]
-
-        # 2. AUGMENT: Fetch its full context from the graph
-        context_query = """
-            MATCH (m:Medicine {name: $med_name})
-            OPTIONAL MATCH (m)-[:TREATS]->(c:Condition)
-            OPTIONAL MATCH (m)-[:HAS_SIDE_EFFECT]->(s:SideEffect)
-            OPTIONAL MATCH (m)-[:CONTAINS_INGREDIENT]->(i:ActiveIngredient)
-            OPTIONAL MATCH (m)-[:MANUFACTURED_BY]->(mf:Manufacturer)
-            RETURN m.name AS medicine,
-                   m.composition AS composition,
-                   m.uses_text AS uses_text,
-                   m.side_effects_text AS side_effects_text,
-                   m.image_url AS image_url,
-                   m.excellent_review_pct AS excellent_review_pct,
-                   m.average_review_pct AS average_review_pct,
-                   m.poor_review_pct AS poor_review_pct,
-                   mf.name AS manufacturer,
-                   collect(DISTINCT c.name) AS uses,
-                   collect(DISTINCT s.name) AS side_effects,
-                   collect(DISTINCT i.name) AS ingredients
-        """
-        context_result = self.db.query(
-            context_query, parameters={"med_name": top_medicine_name}, db="neo4j"
-        )
+        names = self._name_resolver()
+        named = names.find_in(user_query) if names else None
+        with self.db.read_session("neo4j") as session:
+            if named:
+                res = self._read(RAG_NAME_CONTEXT_CYPHER, {"name": named}, session=session)
+                if res:
+                    return {"medicine_found": named, "context": res[0]}
+
+            # A) Condition-first heuristic
+            cond = self._extract_condition_from_query(user_query)
+            context = self._condition_context(cond, session=session) if cond else None
+
+            # B) Vector fallback if no clear condition-based anchor; only then is
+            # the query embedded, and everything stays on the script thread
+            if not context:
+                context = self._vector_context(user_query, session=session)
+                if not context:
+                    return None
 
         return {
-            "medicine_found": top_medicine_name,
-            "context": context_result[0] if context_result else {},
+            "medicine_found": context["medicine"],
+            "context": context,
         }
 
     # ----------------------------
     # Utilities for UI
     # ----------------------------
     def get_graph_for_visualization(self, medicine_name: str) -> list:
-        """Fetches a subgraph for a given medicine for visualization."""
-        query = """
-            MATCH path = (m:Medicine {name: $med_name})-[r]-(n)
-            RETURN m, r, n
+        """Fetches a subgraph for a given medicine for visualization.
+        Returns a single row: the medicine's id/name/label, a `neighbors` list
+        of distinct {id, name, label} maps and a `rels` list of {target, rel}
+        maps, so the centre node is sent once and nodes arrive deduplicated.
         """
-        result = self.db.query(query, parameters={"med_name": medicine_name}, db="neo4j")
+        result = self._read(VISUALIZATION_CYPHER, parameters={"med_name": medicine_name})
         return result if result else []
 
-    def get_medicine_with_image(self, name: str):
-        query = """
-        MATCH (m:Medicine {name: $name})
-        OPTIONAL MATCH (m)-[:TREATS]->(c:Condition)
-        OPTIONAL MATCH (m)-[:HAS_SIDE_EFFECT]->(s:SideEffect)
-        OPTIONAL MATCH (m)-[:CONTAINS_INGREDIENT]->(i:ActiveIngredient)
-        OPTIONAL MATCH (m)-[:MANUFACTURED_BY]->(mf:Manufacturer)
-        RETURN m.name as name, m.image_url AS image_url, m.composition AS composition,
-               m.uses_text AS uses_text, m.side_effects_text AS side_effects_text,
-               collect(DISTINCT c.name) AS conditions,
-               collect(DISTINCT s.name) AS side_effects,
-               collect(DISTINCT i.name) AS ingredients,
-               mf.name AS manufacturer,
-               m.excellent_review_pct AS excellent_review_pct,
-               m.average_review_pct AS average_review_pct,
-               m.poor_review_pct AS poor_review_pct
+    def resolve_medicine_name(self, name: str) -> str:
+        """Canonical medicine name for user input (typos, case, prefixes); input unchanged if unresolved.
+        All names are loaded once per engine and matched client-side.
         """
-        res = self.db.query(query, {"name": name}, db="neo4j")
-        return res[0] if res else None
+        names = self._name_resolver()
+        return (names.resolve(name) if names else None) or name
+
+    def _name_resolver(self) -> NameResolver | None:
+        """All medicine names, loaded on first use; None while the graph is unreachable."""
+        if self._medicine_names is None:
+            # Streamed straight into the resolver rather than through the query cache
+            names = [record["name"] for record in self.db.query_stream(MEDICINE_NAMES_CYPHER, db="neo4j")]
+            if names:
+                self._medicine_names = NameResolver(names)
+        return self._medicine_names
+
+    def get_medicine_with_image(self, name: str):
+        return self.get_medicines_with_image([name]).get(name)
+
+    def get_medicines_with_image(self, names: list[str]) -> dict:
+        """Fetches card info for several medicines in one round trip, keyed by name."""
+        names = list(dict.fromkeys(n for n in names if n))
+        if not names:
+            return {}
+        res = self._read(MEDICINE_CARDS_CYPHER, {"names": names})
+        return {row["name"]: row for row in res} if res else {}
 
-    def symptom_to_medicines(self, symptoms: list[str], limit: int = 10):
+    def symptom_to_medicines(self, symptoms: list[str] | str, limit: int = 10):
         # Leverage side effect nodes to map symptoms -> medicines
-        query = """
-        UNWIND $symptoms AS sym
-        MATCH (s:SideEffect)
-        WHERE toLower(s.name) CONTAINS toLower(sym)
-        MATCH (m:Medicine)-[:HAS_SIDE_EFFECT]->(s)
-        RETURN s.name AS matched_symptom, collect(DISTINCT m.name) AS medicines
-        LIMIT $limit
-        """
-        return self.db.query(query, {"symptoms": symptoms, "limit": limit}, db="neo4j")
+        symptoms = _normalize_terms(symptoms)
+        return self._read(SYMPTOM_TO_MEDICINES_CYPHER, {"symptoms": symptoms, "limit": limit})
 
     def justify_prescription(self, medicines: list[str]):
-        # Return structured data for each medicine for LLM justification step
-        query = """
-        UNWIND $medicines AS med
-        MATCH (m:Medicine {name: med})
-        OPTIONAL MATCH (m)-[:TREATS]->(c:Condition)
-        OPTIONAL MATCH (m)-[:HAS_SIDE_EFFECT]->(s:SideEffect)
-        OPTIONAL MATCH (m)-[:CONTAINS_INGREDIENT]->(i:ActiveIngredient)
-        RETURN m.name AS medicine,
-               m.composition AS composition,
-               collect(DISTINCT c.name) AS conditions,
-               collect(DISTINCT i.name) AS ingredients,
-               collect(DISTINCT s.name) AS side_effects
-        """
-        return self.db.query(query, {"medicines": medicines}, db="neo4j")
+        # Return structured data for each medicine for LLM justification step.
+        # One round trip on a pooled connection, rather than a query (and a
+        # fresh async driver) per medicine.
+        if not medicines:
+            return []
+        return self._read(JUSTIFY_PRESCRIPTION_CYPHER, {"meds": list(medicines)}) or []
 
     def interaction_conflicts(self, medicine: str):
         # Interacts via previously created INTERACTS_WITH rel
-        query = """
-        MATCH (m:Medicine {name: $medicine})-[:INTERACTS_WITH]-(o:Medicine)
-        RETURN o.name AS interacting_medicine
-        LIMIT 25
-        """
-        return self.db.query(query, {"medicine": medicine}, db="neo4j")
+        return self._read(INTERACTION_CONFLICTS_CYPHER, {"medicine": medicine})
@@ -1,22 +1,35 @@
 import os
 import re
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from tqdm import tqdm
 from neo4j import GraphDatabase
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
+from graph_db import SCHEMA_QUERIES, BACKFILL_QUERIES
 
 load_dotenv()
 
 # Default embedding model (384-dim)
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
 VECTOR_INDEX_NAME = os.getenv("VECTOR_INDEX_NAME", "medicine_embeddings")
+# int8-quantized HNSW vectors (Neo4j 5.18+); set to "false" for older servers
+VECTOR_INDEX_QUANTIZATION = os.getenv("VECTOR_INDEX_QUANTIZATION", "true").lower() == "true"
 
 # -----------------------------------------------------------------------------
 # Utility parsing helpers
 # -----------------------------------------------------------------------------
 
+# Patterns are compiled once here rather than looked up on every row
+_DOSAGE_RE = re.compile(r"\([^)]*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+_SENTENCE_SPLIT_RE = re.compile(r"[.;]")
+_CANCER_SPLIT_RE = re.compile(r"cancer", re.I)
+_LEADING_ARTICLE_RE = re.compile(r"^(the |a |an )", re.I)
+# Drops the "Treatment of" boilerplate and collapses whitespace in one pass
+_TREATMENT_PREFIX_RE = re.compile(r"(?:Treatment and prevention of|Treatment of|\s)+")
+
 def parse_active_ingredients(raw: str) -> list[str]:
     if not isinstance(raw, str) or not raw.strip():
         return []
@@ -24,13 +37,13 @@ def parse_active_ingredients(raw: str) -> list[str]:
     cleaned = []
     for p in parts:
         # Remove dosage in parentheses e.g. (500mg) or (0.1% w/w)
-        c = re.sub(r"\([^)]*\)", "", p)
-        c = re.sub(r"\s+", " ", c).strip()
+        c = _DOSAGE_RE.sub("", p)
+        c = _WHITESPACE_RE.sub(" ", c).strip()
         if c:
             cleaned.append(c)
     return cleaned
 
-SIDE_EFFECT_END_WORDS = {"pain","bleeding","change","headache","nosebleeds","skin","pressure","protein","urine","inflammation","rash","injury","nausea","diarrhea","insomnia","weight","loss","vomiting","candidiasis","cramps","drowsiness","dizziness","constipation","flatulence","indigestion","heartburn","appetite","weakness","fatigue","fever","redness","swelling","irritation","itching","tremors","palpitations","photophobia","cramp","burn"}
+SIDE_EFFECT_END_WORDS = frozenset({"pain","bleeding","change","headache","nosebleeds","skin","pressure","protein","urine","inflammation","rash","injury","nausea","diarrhea","insomnia","weight","loss","vomiting","candidiasis","cramps","drowsiness","dizziness","constipation","flatulence","indigestion","heartburn","appetite","weakness","fatigue","fever","redness","swelling","irritation","itching","tremors","palpitations","photophobia","cramp","burn"})
 
 def parse_side_effects(raw: str) -> list[str]:
     if not isinstance(raw, str) or not raw.strip():
@@ -55,43 +68,40 @@ def parse_side_effects(raw: str) -> list[str]:
             current.append(tok)
     if current:
         phrases.append(' '.join(current))
-    # Basic cleanup (dedupe, strip)
-    cleaned = []
-    seen = set()
+    # Basic cleanup (strip, then ordered case-insensitive dedupe keeping the first spelling)
+    cleaned = {}
     for p in phrases:
         c = p.strip(' .;:').strip()
-        if c and c.lower() not in seen:
-            cleaned.append(c)
-            seen.add(c.lower())
-    return cleaned
+        if c:
+            cleaned.setdefault(c.lower(), c)
+    return list(cleaned.values())
 
 CONDITION_KEYWORDS = [
     "cancer","infection","infections","disease","pain","ulcer","reflux","hypertension","asthma","copd","deficiency","migraine","depression","angina","diarrhea","anxiety","allergic","allergies","dermatitis","fissure","cholesterol","osteoporosis","anemia","epilepsy","tuberculosis","heart failure","anal fissure","vitamin","fever"
 ]
+# Single alternation so each sentence is scanned once instead of once per keyword
+_CONDITION_KEYWORD_RE = re.compile("|".join(re.escape(kw.lower()) for kw in CONDITION_KEYWORDS))
 
 def extract_conditions(uses_text: str) -> list[str]:
     if not isinstance(uses_text, str) or not uses_text.strip():
         return []
-    text = uses_text.replace('Treatment of', ' ').replace('Treatment and prevention of', ' ')
-    text = re.sub(r"\s+", " ", text)
+    text = _TREATMENT_PREFIX_RE.sub(" ", uses_text)
     candidates = []
     # Split by two or more spaces or periods if present
-    splits = re.split(r"[.;]", text)
+    splits = _SENTENCE_SPLIT_RE.split(text)
     for s in splits:
         s = s.strip()
         if not s:
             continue
         # Heuristic: break into phrases containing a condition keyword
-        for kw in CONDITION_KEYWORDS:
-            if kw.lower() in s.lower():
-                candidates.append(s)
-                break
+        if _CONDITION_KEYWORD_RE.search(s.lower()):
+            candidates.append(s)
     # Additional splitting for multi-condition strings (e.g. multiple cancers)
     refined = []
     for c in candidates:
         # Attempt to separate multiple conditions by ' cancer' etc
         if ' cancer' in c.lower():
-            parts = re.split(r"(?i)cancer", c)
+            parts = _CANCER_SPLIT_RE.split(c)
             tmp = []
             for p in parts[:-1]:
                 p = p.strip(' ,;')
@@ -105,19 +115,14 @@ def extract_conditions(uses_text: str) -> list[str]:
                 continue
         refined.append(c)
     # Normalize: Title case, trim
-    norm = []
-    seen = set()
+    norm = {}
     for r in refined:
-        c = re.sub(r"\s+", " ", r).strip(' ,')
+        c = _WHITESPACE_RE.sub(" ", r).strip(' ,')
         # Remove leading generic words
-        c = re.sub(r"^(the |a |an )", "", c, flags=re.I)
-        if len(c) < 3:
-            continue
-        key = c.lower()
-        if key not in seen:
-            seen.add(key)
-            norm.append(c)
-    return norm[:12]  # limit to avoid explosion
+        c = _LEADING_ARTICLE_RE.sub("", c)
+        if len(c) >= 3:
+            norm.setdefault(c.lower(), c)
+    return list(norm.values())[:12]  # limit to avoid explosion
 
 # -----------------------------------------------------------------------------
 # Neo4j Loader
@@ -133,128 +138,213 @@ def get_driver():
     driver.verify_connectivity()
     return driver
 
-SCHEMA_QUERIES = [
-    "CREATE CONSTRAINT medicine_name IF NOT EXISTS FOR (m:Medicine) REQUIRE m.name IS UNIQUE",
-    "CREATE CONSTRAINT ingredient_name IF NOT EXISTS FOR (i:ActiveIngredient) REQUIRE i.name IS UNIQUE",
-    "CREATE CONSTRAINT side_effect_name IF NOT EXISTS FOR (s:SideEffect) REQUIRE s.name IS UNIQUE",
-    "CREATE CONSTRAINT condition_name IF NOT EXISTS FOR (c:Condition) REQUIRE c.name IS UNIQUE",
-    "CREATE CONSTRAINT manufacturer_name IF NOT EXISTS FOR (mf:Manufacturer) REQUIRE mf.name IS UNIQUE"
-]
-
 VECTOR_INDEX_CYPHER = f"""
 CREATE VECTOR INDEX {VECTOR_INDEX_NAME} IF NOT EXISTS
 FOR (m:Medicine) ON m.embedding
-OPTIONS {{ indexConfig: {{ `vector.dimensions`: 384, `vector.similarity_function`: 'cosine' }} }}
-"""
-
-MERGE_MEDICINE_CYPHER = """
-MERGE (m:Medicine {name: $name})
-SET m.composition=$composition,
-    m.uses_text=$uses_text,
-    m.side_effects_text=$side_effects_text,
-    m.image_url=$image_url,
-    m.excellent_review_pct=$excellent_review_pct,
-    m.average_review_pct=$average_review_pct,
-    m.poor_review_pct=$poor_review_pct,
-    m.embedding=$embedding
+OPTIONS {{ indexConfig: {{ `vector.dimensions`: 384, `vector.similarity_function`: 'cosine'{", `vector.quantization.enabled`: true" if VECTOR_INDEX_QUANTIZATION else ""} }} }}
 """
 
-MERGE_MANUFACTURER_REL = """
-MERGE (mf:Manufacturer {name: $manufacturer})
-MERGE (m:Medicine {name: $medicine_name})
+# Each batch is one transaction: shared entities are first merged once per
+# distinct name (ENTITY_MERGE_CYPHER), then a single statement writes every
+# medicine and only MATCHes those entities to merge the relationships.
+# name_lower is derived from the (immutable) merge key, so it is only written
+# on creation.
+ENTITY_MERGE_CYPHER = {
+    'manufacturers': "UNWIND $names AS name MERGE (:Manufacturer {name: name})",
+    'ingredients': "UNWIND $names AS name MERGE (:ActiveIngredient {name: name})",
+    'side_effects': "UNWIND $names AS name MERGE (s:SideEffect {name: name}) ON CREATE SET s.name_lower = toLower(name)",
+    'conditions': "UNWIND $names AS name MERGE (c:Condition {name: name}) ON CREATE SET c.name_lower = toLower(name)",
+}
+
+MERGE_MEDICINES_BATCH_CYPHER = """
+UNWIND $rows AS row
+MERGE (m:Medicine {name: row.name})
+SET m.composition = row.composition,
+    m.uses_text = row.uses_text,
+    m.uses_text_lower = row.uses_text_lower,
+    m.side_effects_text = row.side_effects_text,
+    m.image_url = row.image_url,
+    m.excellent_review_pct = row.excellent_review_pct,
+    m.average_review_pct = row.average_review_pct,
+    m.poor_review_pct = row.poor_review_pct
+// Stored as a float32 vector rather than a plain list (float64): half the
+// store size and page-cache footprint for the 384-d embeddings
+CALL db.create.setNodeVectorProperty(m, 'embedding', row.embedding)
+WITH m, row
+MATCH (mf:Manufacturer {name: row.manufacturer})
 MERGE (m)-[:MANUFACTURED_BY]->(mf)
+WITH m, row
+CALL {
+    WITH m, row
+    UNWIND row.ingredients AS ing
+    MATCH (i:ActiveIngredient {name: ing})
+    MERGE (m)-[:CONTAINS_INGREDIENT]->(i)
+}
+CALL {
+    WITH m, row
+    UNWIND row.side_effects AS se
+    MATCH (s:SideEffect {name: se})
+    MERGE (m)-[:HAS_SIDE_EFFECT]->(s)
+}
+CALL {
+    WITH m, row
+    UNWIND row.conditions AS cond
+    MATCH (c:Condition {name: cond})
+    MERGE (m)-[:TREATS]->(c)
+}
 """
 
-MERGE_INGREDIENT_REL = """
-MERGE (i:ActiveIngredient {name: $ingredient})
-MERGE (m:Medicine {name: $medicine_name})
-MERGE (m)-[:CONTAINS_INGREDIENT]->(i)
-"""
-
-MERGE_SIDE_EFFECT_REL = """
-MERGE (s:SideEffect {name: $side_effect})
-MERGE (m:Medicine {name: $medicine_name})
-MERGE (m)-[:HAS_SIDE_EFFECT]->(s)
-"""
-
-MERGE_CONDITION_REL = """
-MERGE (c:Condition {name: $condition})
-MERGE (m:Medicine {name: $medicine_name})
-MERGE (m)-[:TREATS]->(c)
-"""
-
+# Pairs are built per ingredient inside a subquery, so each pairing is bounded
+# by that ingredient's medicines, and committed in batches rather than as one
+# huge transaction.
 CREATE_SHARED_INGREDIENT_REL = """
-MATCH (i:ActiveIngredient)<-[:CONTAINS_INGREDIENT]-(m1:Medicine), (i)<-[:CONTAINS_INGREDIENT]-(m2:Medicine)
-WHERE id(m1) < id(m2)
-MERGE (m1)-[:INTERACTS_WITH {basis:'shared_ingredient', ingredient: i.name}]->(m2)
+MATCH (i:ActiveIngredient)
+CALL {
+  WITH i
+  MATCH (i)<-[:CONTAINS_INGREDIENT]-(m1:Medicine)
+  MATCH (i)<-[:CONTAINS_INGREDIENT]-(m2:Medicine)
+  WHERE elementId(m1) < elementId(m2)
+  MERGE (m1)-[:INTERACTS_WITH {basis:'shared_ingredient', ingredient: i.name}]->(m2)
+} IN TRANSACTIONS OF 100 ROWS
 """
 
 # -----------------------------------------------------------------------------
 # Main ingestion logic
 # -----------------------------------------------------------------------------
 
-def build_embedding_text(row: pd.Series) -> str:
+CSV_TEXT_COLUMNS = ['Medicine Name', 'Composition', 'Uses', 'Side_effects', 'Image URL', 'Manufacturer']
+CSV_REVIEW_COLUMNS = ['Excellent Review %', 'Average Review %', 'Poor Review %']
+
+def read_medicine_csv(csv_path: str, limit: int | None = None) -> pd.DataFrame:
+    """Single-pass CSV read: only the columns we use, text kept as str, and
+    missing cells left as "" (na_filter=False) instead of NaN."""
+    return pd.read_csv(
+        csv_path,
+        usecols=CSV_TEXT_COLUMNS + CSV_REVIEW_COLUMNS,
+        dtype={col: str for col in CSV_TEXT_COLUMNS},
+        na_filter=False,
+        engine='c',
+        nrows=limit,
+    )
+
+def build_embedding_text(row: dict) -> str:
     parts = [str(row.get('Medicine Name','')), str(row.get('Composition','')), str(row.get('Uses','')), str(row.get('Side_effects','')), str(row.get('Manufacturer',''))]
-    return ' | '.join(p for p in parts if p and p != 'nan')
+    return ' | '.join(p for p in parts if p)
+
+def _review_pct(row: dict, column: str) -> int:
+    value = row.get(column)
+    return int(value) if value != '' else 0
+
+def build_medicine_row(row: dict, embedding: list[float]) -> dict:
+    """Turns a CSV record into the parameter map consumed by MERGE_MEDICINES_BATCH_CYPHER."""
+    composition = row.get('Composition','')
+    uses_text = row.get('Uses','')
+    side_effects_raw = row.get('Side_effects','')
+    manufacturer = row.get('Manufacturer','Unknown')
+    return {
+        'name': row.get('Medicine Name'),
+        'composition': composition,
+        'uses_text': uses_text,
+        'uses_text_lower': uses_text.lower() if isinstance(uses_text, str) else None,
+        'side_effects_text': side_effects_raw,
+        'image_url': row.get('Image URL',''),
+        'manufacturer': manufacturer if isinstance(manufacturer, str) and manufacturer.strip() else 'Unknown',
+        'excellent_review_pct': _review_pct(row, 'Excellent Review %'),
+        'average_review_pct': _review_pct(row, 'Average Review %'),
+        'poor_review_pct': _review_pct(row, 'Poor Review %'),
+        'embedding': embedding,
+        'ingredients': parse_active_ingredients(composition),
+        'side_effects': parse_side_effects(side_effects_raw),
+        'conditions': extract_conditions(uses_text),
+    }
+
+def collect_entities(rows: list[dict]) -> dict[str, list[str]]:
+    """Distinct shared-entity names referenced by a batch, keyed like ENTITY_MERGE_CYPHER."""
+    entities = {key: {} for key in ENTITY_MERGE_CYPHER}
+    for row in rows:
+        entities['manufacturers'][row['manufacturer']] = None
+        for key in ('ingredients', 'side_effects', 'conditions'):
+            entities[key].update(dict.fromkeys(row[key]))
+    return {key: list(names) for key, names in entities.items()}
+
+def _merge_entities(tx, entities: dict[str, list[str]]):
+    for key, names in entities.items():
+        if names:
+            tx.run(ENTITY_MERGE_CYPHER[key], names=names).consume()
+
+def _write_medicines(tx, rows: list[dict]):
+    tx.run(MERGE_MEDICINES_BATCH_CYPHER, rows=rows).consume()
+
+def _load_batch(driver, rows: list[dict]) -> int:
+    # Sessions are not thread-safe, so each worker opens its own (the driver is shared)
+    with driver.session() as session:
+        session.execute_write(_write_medicines, rows)
+    return len(rows)
+
+def create_schema(session):
+    for q in SCHEMA_QUERIES:
+        session.run(q).consume()
+    session.run(VECTOR_INDEX_CYPHER).consume()
+
+def backfill(session):
+    for q in BACKFILL_QUERIES:
+        session.run(q).consume()
 
-def ingest(csv_path: str, limit: int | None = None, clear: bool = False):
+def migrate():
+    """One-off upgrade of an existing graph: schema plus lowercase-copy backfill, no CSV load."""
     driver = get_driver()
-    df = pd.read_csv(csv_path)
-    if limit:
-        df = df.head(limit)
+    with driver.session() as session:
+        create_schema(session)
+        backfill(session)
+    driver.close()
+    print("Migration complete.")
+
+# Upper bound on rows per transaction when several writers run at once
+PARALLEL_BATCH_SIZE = 200
+
+def ingest(csv_path: str, limit: int | None = None, clear: bool = False, batch_size: int = 1000, workers: int = 1):
+    driver = get_driver()
+    if workers > 1:
+        # Concurrent batches MERGE relationships onto the same hub nodes
+        # (popular side effects, manufacturers), so they contend for the same
+        # locks and can deadlock. Small transactions keep each conflict (and
+        # its retry) cheap enough to finish inside the driver's retry window.
+        batch_size = min(batch_size, PARALLEL_BATCH_SIZE)
+    df = read_medicine_csv(csv_path, limit)
 
     model = SentenceTransformer(EMBEDDING_MODEL)
 
     with driver.session() as session:
         if clear:
             session.run("MATCH (n) DETACH DELETE n")
-        for q in SCHEMA_QUERIES:
-            session.run(q)
-        session.run(VECTOR_INDEX_CYPHER)
-
-        for _, row in tqdm(df.iterrows(), total=len(df), desc="Loading medicines"):
-            name = row.get('Medicine Name')
-            composition = row.get('Composition','')
-            uses_text = row.get('Uses','')
-            side_effects_raw = row.get('Side_effects','')
-            image_url = row.get('Image URL','')
-            manufacturer = row.get('Manufacturer','Unknown')
-            excellent = int(row.get('Excellent Review %',0)) if not pd.isna(row.get('Excellent Review %')) else 0
-            average = int(row.get('Average Review %',0)) if not pd.isna(row.get('Average Review %')) else 0
-            poor = int(row.get('Poor Review %',0)) if not pd.isna(row.get('Poor Review %')) else 0
-
-            embedding_text = build_embedding_text(row)
-            embedding = model.encode(embedding_text).tolist()
-
-            session.run(MERGE_MEDICINE_CYPHER, {
-                'name': name,
-                'composition': composition,
-                'uses_text': uses_text,
-                'side_effects_text': side_effects_raw,
-                'image_url': image_url,
-                'excellent_review_pct': excellent,
-                'average_review_pct': average,
-                'poor_review_pct': poor,
-                'embedding': embedding
-            })
-
-            session.run(MERGE_MANUFACTURER_REL, {'manufacturer': manufacturer, 'medicine_name': name})
-
-            # Active Ingredients
-            for ing in parse_active_ingredients(composition):
-                session.run(MERGE_INGREDIENT_REL, {'ingredient': ing, 'medicine_name': name})
-
-            # Side Effects
-            for se in parse_side_effects(side_effects_raw):
-                session.run(MERGE_SIDE_EFFECT_REL, {'side_effect': se, 'medicine_name': name})
-
-            # Conditions
-            for cond in extract_conditions(uses_text):
-                session.run(MERGE_CONDITION_REL, {'condition': cond, 'medicine_name': name})
+        create_schema(session)
+
+        # Entity nodes are merged on this thread before their batch is handed to
+        # the pool, so workers only MATCH shared nodes and merge relationships;
+        # execute_write retries any transient lock conflicts between workers.
+        # With the default single worker, batches are written one at a time.
+        with tqdm(total=len(df), desc="Loading medicines") as progress, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = []
+            for start in range(0, len(df), batch_size):
+                # Plain dict records avoid iterrows() boxing every row into a Series
+                records = df.iloc[start:start + batch_size].to_dict('records')
+                embeddings = model.encode([build_embedding_text(r) for r in records], batch_size=64).tolist()
+                rows = [build_medicine_row(r, emb) for r, emb in zip(records, embeddings)]
+                session.execute_write(_merge_entities, collect_entities(rows))
+                future = pool.submit(_load_batch, driver, rows)
+                future.add_done_callback(lambda f: progress.update(f.result()))
+                pending.append(future)
+            for future in pending:
+                future.result()
 
         # Interaction relationships (shared ingredient)
         session.run(CREATE_SHARED_INGREDIENT_REL)
 
+        # name_lower is only set when a node is created, so nodes that predate
+        # it (an ingest over an older graph without --clear) are filled here
+        backfill(session)
+
     driver.close()
     print("Ingestion complete.")
     print(f"Loaded {len(df)} medicines. Vector index: {VECTOR_INDEX_NAME}")
@@ -268,8 +358,16 @@ def main():
     parser.add_argument('--csv', default='data/Medicine_Details.csv', help='Path to CSV file')
     parser.add_argument('--limit', type=int, help='Limit rows for debugging')
     parser.add_argument('--clear', action='store_true', help='Clear existing graph data first')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per UNWIND transaction')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Concurrent batch writers (>1 caps batches at 200 rows; may hit lock retries on hub nodes)')
+    parser.add_argument('--migrate', action='store_true',
+                        help='Only create the schema and backfill lowercase properties on an existing graph')
     args = parser.parse_args()
-    ingest(args.csv, args.limit, args.clear)
+    if args.migrate:
+        migrate()
+        return
+    ingest(args.csv, args.limit, args.clear, args.batch_size, args.workers)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import faiss
+import numpy as np
+import streamlit as st
+
+# --- CONFIGURATION ---
+SEMANTIC_CACHE_SIZE = 512
+SEMANTIC_CACHE_THRESHOLD = 0.92
+EXACT_CACHE_SIZE = 512
+
+
+class SemanticCache:
+    """
+    An LRU cache keyed by query embeddings.
+    A lookup hits when a stored embedding has cosine similarity >= `threshold`
+    with the query embedding, so near-identical questions share one answer.
+    """
+
+    def __init__(self, maxsize: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._index = None
+        self._entries = OrderedDict()  # id -> cached value, oldest first
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype="float32").reshape(1, -1).copy()
+        faiss.normalize_L2(vec)
+        return vec
+
+    def get(self, embedding):
+        """Returns the cached value for the closest stored embedding, or None."""
+        with self._lock:
+            if self._index is None or not self._entries:
+                return None
+            scores, ids = self._index.search(self._normalize(embedding), 1)
+            entry_id = int(ids[0][0])
+            if entry_id < 0 or scores[0][0] < self.threshold:
+                return None
+            self._entries.move_to_end(entry_id)
+            return self._entries[entry_id]
+
+    def put(self, embedding, value):
+        """Stores `value` under `embedding`, evicting the least recently used entry if full."""
+        vec = self._normalize(embedding)
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(vec.shape[1]))
+            if len(self._entries) >= self.maxsize:
+                oldest_id, _ = self._entries.popitem(last=False)
+                self._index.remove_ids(np.array([oldest_id], dtype="int64"))
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vec, np.array([entry_id], dtype="int64"))
+            self._entries[entry_id] = value
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+            self._entries.clear()
+
+
+class ExactCache:
+    """A thread-safe LRU cache for exact keys, checked before the semantic tier."""
+
+    def __init__(self, maxsize: int = EXACT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def normalize_question(question: str) -> str:
+    """Canonical form of a user question used for cache keys."""
+    return " ".join(question.lower().split())
+
+
+def context_key(context_str: str) -> str:
+    """Digest of a serialized RAG context (llm_chains.serialize_context), so
+    cached answers are only reused for the same facts. Hashing the prompt's
+    own serialization avoids dumping the context a second time."""
+    return hashlib.blake2b(context_str.encode(), digest_size=16).hexdigest()
+
+
+@st.cache_resource
+def get_response_cache() -> SemanticCache:
+    """Returns the process-wide semantic cache for RAG responses."""
+    return SemanticCache()
+
+
+@st.cache_resource
+def get_exact_response_cache() -> ExactCache:
+    """Returns the process-wide exact-match cache for RAG responses, keyed by (question, context key)."""
+    return ExactCache()
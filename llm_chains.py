@@ -22,33 +22,131 @@ def get_groq_client():
         raise ValueError("GROQ_API_KEY not found. Please set it in your .env file or Streamlit secrets.")
     return groq.Groq(api_key=groq_api_key)
 
-def get_rag_response(user_query: str, context: dict, groq_client) -> str:
-    """Generates a response from the LLM based on the user's query and retrieved context."""
-
-    context_str = json.dumps(context, indent=2)
-
-    system_prompt = """
-    You are a friendly and knowledgeable AI Drug Assistant.
-    Use ONLY the provided structured context (which may include composition, raw use text, parsed uses (conditions), side_effects, ingredients, manufacturer, review percentages, and image_url).
-    Guidelines:
-    - If asked to explain: summarize composition (plain terms), primary uses (conditions), and major side effects.
-    - If asked to compare or recommend and only one medicine is provided, say more data may be needed.
-    - If review percentages exist, include a short sentiment summary.
-    - If image_url present, mention that an image is available (do NOT fabricate description of the image content beyond name).
-    - Do NOT invent medical advice beyond the context – if missing, state that.
-    """
+def warm_up_groq_client(groq_client):
+    """Makes a cheap authenticated request so the HTTPS connection is open
+    before the first completion. Failures are ignored."""
+    try:
+        groq_client.models.list()
+    except Exception as e:
+        print(f"Groq warm-up failed: {e}")
+
+RAG_MODEL = "llama-3.1-8b-instant"
+
+# Roughly 50 tokens; streamed text is flushed to the UI in pieces of at least
+# this many characters so each chunk doesn't trigger its own re-render.
+STREAM_FLUSH_CHARS = 200
+
+# Static and byte-identical on every call: providers that cache prompt prefixes
+# can then reuse it, followed by the context block, with the question last.
+RAG_SYSTEM_PROMPT = """You are a friendly and knowledgeable AI Drug Assistant.
+Use ONLY the provided structured context (which may include composition, raw use text, parsed uses (conditions), side_effects, ingredients, manufacturer, review percentages, and image_url).
+Guidelines:
+- If asked to explain: summarize composition (plain terms), primary uses (conditions), and major side effects.
+- If asked to compare or recommend and only one medicine is provided, say more data may be needed.
+- If review percentages exist, include a short sentiment summary.
+- If image_url present, mention that an image is available (do NOT fabricate description of the image content beyond name).
+- Do NOT invent medical advice beyond the context – if missing, state that.
+- Return a concise, bullet-style answer when listing items."""
+_RAG_SYSTEM_MESSAGE = {"role": "system", "content": RAG_SYSTEM_PROMPT}
+
+# Prompt-side context pruning: input tokens drive both cost and prefill time
+CONTEXT_DROP_KEYS = frozenset({"embedding"})
+CONTEXT_LIST_LIMIT = 20
+
+def prune_context(context: dict) -> dict:
+    """Drops what the LLM doesn't need: empty fields, vectors, the raw
+    side-effect text when its parsed list is present, and list entries past
+    CONTEXT_LIST_LIMIT. Deterministic, so equal contexts still serialize (and
+    cache) identically."""
+    pruned = {
+        key: value[:CONTEXT_LIST_LIMIT] if isinstance(value, list) else value
+        for key, value in context.items()
+        if key not in CONTEXT_DROP_KEYS and value not in (None, "", [])
+    }
+    if pruned.get("side_effects"):
+        pruned.pop("side_effects_text", None)
+    return pruned
+
+def serialize_context(context: dict) -> str:
+    """The (pruned) context block as sent to the LLM. Callers that also need it
+    for a cache key can serialize once and pass the string instead of the dict.
+    Single-line JSON: indentation would only add whitespace tokens."""
+    return json.dumps(prune_context(context), ensure_ascii=False, separators=(", ", ": "))
+
+def _build_rag_messages(user_query: str, context: dict | str) -> list[dict]:
+    """Builds the system + context + question messages for a RAG answer."""
+
+    context_str = context if isinstance(context, str) else serialize_context(context)
 
-    human_prompt = f"""Structured Context:\n{context_str}\n\nUser Question: {user_query}\n\nReturn a concise, bullet-style answer when listing items."""
+    return [
+        _RAG_SYSTEM_MESSAGE,
+        {"role": "user", "content": f"Structured Context:\n{context_str}"},
+        {"role": "user", "content": f"User Question: {user_query}"},
+    ]
 
+def get_rag_response(user_query: str, context: dict | str, groq_client, model: str = RAG_MODEL, stream: bool = False):
+    """Generates a response from the LLM based on the user's query and retrieved context.
+    With `stream=True` this returns `stream_rag_response`'s `RagAnswerStream` instead of a string.
+    """
+    if stream:
+        return stream_rag_response(user_query, context, groq_client, model=model)
     try:
         chat_completion = groq_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": human_prompt},
-            ],
-            model="llama-3.1-8b-instant",
+            messages=_build_rag_messages(user_query, context),
+            model=model,
             temperature=0.3,
         )
         return chat_completion.choices[0].message.content
     except Exception as e:
         return f"An error occurred while generating the response: {e}"
+
+class RagAnswerStream:
+    """Iterates the text deltas of a streaming completion in batches of at least `flush_chars`.
+    Errors are shown inline, and `failed` is set so callers can tell a broken answer from a good one.
+    """
+
+    def __init__(self, stream=None, flush_chars: int = STREAM_FLUSH_CHARS, error: Exception | None = None):
+        self._stream = stream
+        self._flush_chars = flush_chars
+        self._error = error
+        self.failed = error is not None
+
+    def __iter__(self):
+        if self._error is not None:
+            yield f"An error occurred while generating the response: {self._error}"
+            return
+        buffer = []
+        size = 0
+        try:
+            for chunk in self._stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                buffer.append(delta)
+                size += len(delta)
+                if size >= self._flush_chars:
+                    yield "".join(buffer)
+                    buffer = []
+                    size = 0
+        except Exception as e:
+            self.failed = True
+            buffer.append(f"\n\nAn error occurred while streaming the response: {e}")
+        if buffer:
+            yield "".join(buffer)
+
+def stream_rag_response(user_query: str, context: dict | str, groq_client, flush_chars: int = STREAM_FLUSH_CHARS,
+                        model: str = RAG_MODEL):
+    """Streaming variant of `get_rag_response`.
+    The request is sent immediately; the returned `RagAnswerStream` yields the answer
+    text in batched chunks, suitable for `st.write_stream`.
+    """
+    try:
+        stream = groq_client.chat.completions.create(
+            messages=_build_rag_messages(user_query, context),
+            model=model,
+            temperature=0.3,
+            stream=True,
+        )
+    except Exception as e:
+        return RagAnswerStream(error=e)
+    return RagAnswerStream(stream, flush_chars)
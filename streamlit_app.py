@@ -1,9 +1,14 @@
 import streamlit as st
 import os
+import json
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 from dotenv import load_dotenv
 from graph_rag_query import GraphQueryEngine
-from llm_chains import get_rag_response, get_groq_client
+from llm_chains import stream_rag_response, serialize_context, get_groq_client, warm_up_groq_client
+from llm_cache import get_response_cache, get_exact_response_cache, normalize_question, context_key
 from streamlit_agraph import agraph, Node, Edge, Config
 
 # --- CONFIGURATION ---
@@ -31,26 +36,36 @@ st.markdown("""
 <hr style='margin-top:0.25rem;margin-bottom:1rem;'>
 """, unsafe_allow_html=True)
 
+# Node colours for the graph visualization, keyed by neighbour label
+VIS_COLOR_MAP = {"Condition": "#ffb3c6", "SideEffect": "#b3d9ff", "ActiveIngredient": "#baf5ba", "Manufacturer": "#ffe1a8"}
+# Edge captions for the known relationship types; unknown types fall back to title-casing
+REL_LABELS = {rel: rel.replace("_", " ").title() for rel in ("TREATS", "HAS_SIDE_EFFECT", "CONTAINS_INGREDIENT", "MANUFACTURED_BY", "INTERACTS_WITH")}
+
 # --- HELPER FUNCTIONS ---
 @st.cache_data(show_spinner=False)
 def _cache_med_card(name: str):
     """Return a JSON-serialisable dict for a medicine card.
-    Converts Neo4j Record objects into plain dicts so Streamlit caching & hashing work.
+    The engine already returns rows as plain dicts, so they cache & hash as-is.
     """
-    record = engine.get_medicine_with_image(name)
-    if record is None:
-        return None
-    # neo4j.Record provides .data() in recent drivers
-    try:
-        if hasattr(record, "data"):
-            record = record.data()
-        else:
-            # Fallback: attempt to build dict from items()
-            record = {k: record[k] for k in record.keys()} if hasattr(record, "keys") else dict(record)
-    except Exception:
-        # As last resort wrap in dict with name only
-        return {"name": name}
-    return record
+    return engine.get_medicine_with_image(name)
+
+@st.cache_data(show_spinner=False)
+def _cache_med_cards(names: tuple[str, ...]):
+    """Batch variant of `_cache_med_card`: one query for every card in a result list."""
+    return engine.get_medicines_with_image(list(names))
+
+def resolve_medicine_input(name: str) -> str:
+    """Canonical medicine name for a text input, with a caption when it differs
+    from what was typed (a prefix or fuzzy match stood in for it)."""
+    resolved = engine.resolve_medicine_name(name)
+    if resolved != name.strip():
+        st.caption(f"Showing results for {resolved}")
+    return resolved
+
+def card_from_rag_context(context: dict) -> dict:
+    """The RAG context already carries every card field (under its own key
+    names), so the anchor card is built from it instead of re-querying."""
+    return {**context, "name": context.get("medicine"), "conditions": context.get("uses", [])}
 
 def sanitize_image_url(image_url: str | None):
     if not image_url or not isinstance(image_url, str):
@@ -142,24 +157,37 @@ def render_medicine_card(med_card, show_sections: list[str] | None = None, expan
                 with st.expander("Raw Side Effects Text"):
                     st.write(med_card['side_effects_text'])
 
+def render_json(payload):
+    """Render a payload as pre-serialized JSON text.
+    Cheaper than st.json for large graph contexts: the string is built once
+    server-side and shown as a static code block instead of an interactive tree.
+    """
+    st.code(json.dumps(payload, indent=2, ensure_ascii=False, default=str), language="json")
+
 def display_results(result):
     if not result:
         st.warning("No results found.")
         return
     if isinstance(result, list):
         for record in result:
-            st.json(record)
+            render_json(record)
     else:
-        st.json(result)
+        render_json(result)
 
 # --- INITIALIZE ENGINES ---
+# Both run once per process; the warm-ups move connection setup off the
+# first user click.
 @st.cache_resource
 def init_query_engine():
-    return GraphQueryEngine()
+    engine = GraphQueryEngine()
+    engine.db.warmup()
+    return engine
 
 @st.cache_resource
 def init_groq_client():
-    return get_groq_client()
+    client = get_groq_client()
+    threading.Thread(target=warm_up_groq_client, args=(client,), daemon=True).start()
+    return client
 
 engine = init_query_engine()
 groq_client = init_groq_client()
@@ -196,14 +224,46 @@ with tab1:
                 st.error("No relevant medicine found for that query.")
             else:
                 med_name = rag_context['medicine_found']
-                med_card = _cache_med_card(med_name)
-                st.success(f"Top relevant medicine: {med_name}")
-                render_medicine_card(med_card, expandable=False, subtitle="RAG Anchor")
-                response = get_rag_response(user_query, rag_context['context'], groq_client)
-                st.subheader("LLM Response")
-                st.markdown(response)
+                context_str = serialize_context(rag_context['context'])
+                ctx_key = context_key(context_str)
+                # Exact question first, then a semantically similar one; either
+                # only counts if it was answered from this same context
+                response_cache = get_response_cache()
+                exact_responses = get_exact_response_cache()
+                question = normalize_question(user_query)
+                question_embedding = None
+                cached = exact_responses.get((question, ctx_key))
+                semantic_hit = False
+                if cached is None:
+                    question_embedding = engine.get_embedding(question)
+                    similar = response_cache.get(question_embedding)
+                    if similar and similar['context_key'] == ctx_key:
+                        cached = similar['response']
+                        semantic_hit = True
+                med_card = card_from_rag_context(rag_context['context'])
+                if cached is not None:
+                    st.success(f"Top relevant medicine: {med_name}")
+                    render_medicine_card(med_card, expandable=False, subtitle="RAG Anchor")
+                    st.subheader("LLM Response")
+                    st.markdown(cached)
+                    if semantic_hit:
+                        st.caption("Answer served from cache for a similar question.")
+                else:
+                    # Start generation right away so the LLM round-trip overlaps
+                    # with the card rendering below.
+                    with ThreadPoolExecutor(max_workers=1) as llm_pool:
+                        response_future = llm_pool.submit(stream_rag_response, user_query, context_str, groq_client)
+                        st.success(f"Top relevant medicine: {med_name}")
+                        render_medicine_card(med_card, expandable=False, subtitle="RAG Anchor")
+                        response_stream = response_future.result()
+                    st.subheader("LLM Response")
+                    response = st.write_stream(iter(response_stream))
+                    # Empty or failed answers are never cached
+                    if not response_stream.failed and isinstance(response, str) and response.strip():
+                        exact_responses.put((question, ctx_key), response)
+                        response_cache.put(question_embedding, {"context_key": ctx_key, "response": response})
                 with st.expander("🔬 Raw Graph Context JSON"):
-                    st.json(rag_context['context'])
+                    render_json(rag_context['context'])
 
 with tab2:
     st.header("💊 Direct Medicine Lookup")
@@ -215,12 +275,12 @@ with tab2:
         go_lookup = st.button("Lookup")
     if go_lookup:
         with st.spinner("Querying graph..."):
-            med_card = _cache_med_card(med_name_direct)
+            med_card = _cache_med_card(resolve_medicine_input(med_name_direct))
             render_medicine_card(med_card, expandable=False)
 
 with tab3:
     st.header("🩺 Reverse Lookup by Condition")
-    st.write("Find medicines that treat a given condition.")
+    st.write("Find medicines that treat a given condition (separate several with commas).")
     cond_cols = st.columns([3,1])
     with cond_cols[0]:
         condition_name = st.text_input("Condition", "Hypoglycemia", key="reverse")
@@ -228,12 +288,16 @@ with tab3:
         go_reverse = st.button("Find")
     if go_reverse:
         with st.spinner("Searching graph..."):
-            result = engine.reverse_lookup(condition_name)
-            if result:
-                st.subheader(f"Medicines for {condition_name}")
-                for med_name in result:
-                    med_card = _cache_med_card(med_name)
-                    render_medicine_card(med_card, expandable=True)
+            results = engine.reverse_lookup_many(condition_name.split(","))
+            all_meds = tuple(dict.fromkeys(m for meds in results.values() for m in meds))
+            if all_meds:
+                med_cards = _cache_med_cards(all_meds)
+                for cond, meds in results.items():
+                    st.subheader(f"Medicines for {cond}")
+                    if not meds:
+                        st.info("No matches.")
+                    for med_name in meds:
+                        render_medicine_card(med_cards.get(med_name), expandable=True)
             else:
                 st.info("No matches.")
 
@@ -247,13 +311,13 @@ with tab4:
         go_inter = st.button("Check")
     if go_inter:
         with st.spinner("Resolving ingredient overlaps..."):
-            result = engine.check_interactions(med_name_interact)
+            result = engine.check_interactions(resolve_medicine_input(med_name_interact))
             if result:
+                med_cards = _cache_med_cards(tuple(i.get('other_medicine') for i in result if i.get('other_medicine')))
                 for interaction in result:
                     other_med = interaction.get('other_medicine')
                     shared = interaction.get('shared_ingredient')
-                    med_card = _cache_med_card(other_med) if other_med else None
-                    render_medicine_card(med_card, expandable=True, subtitle=f"Shared: {shared}")
+                    render_medicine_card(med_cards.get(other_med), expandable=True, subtitle=f"Shared: {shared}")
             else:
                 st.info("None found.")
 
@@ -269,9 +333,9 @@ with tab5:
         with st.spinner("Running vector index query..."):
             result = engine.vector_similarity_search(query_text)
             if result:
+                med_cards = _cache_med_cards(tuple(r.get('medicine.name') for r in result if r.get('medicine.name')))
                 for med_result in result:
-                    med_name = med_result.get('medicine.name')
-                    med_card = _cache_med_card(med_name) if med_name else None
+                    med_card = med_cards.get(med_result.get('medicine.name'))
                     render_medicine_card(med_card, expandable=True, subtitle=f"Score: {med_result.get('score', 0):.3f}")
             else:
                 st.info("No similar medicines found.")
@@ -285,35 +349,49 @@ with tab6:
     with vis_cols[1]:
         go_vis = st.button("Render")
 
+    expand_graph = st.checkbox("Add to current graph", key="vis_expand", help="Merge this medicine's neighbourhood into the graph already shown instead of replacing it.")
+
+    # The rendered graph lives in session state (nodes/edges keyed by id), so
+    # unrelated reruns redraw it without a query and expanding only appends
+    # the nodes and edges that are not on screen yet.
+    if "vis_nodes" not in st.session_state:
+        st.session_state["vis_nodes"] = {}
+        st.session_state["vis_edges"] = {}
+
     if go_vis and vis_medicine:
         with st.spinner("Building graph model..."):
-            results = engine.get_graph_for_visualization(vis_medicine)
-            if results:
-                nodes = []
-                edges = []
-                node_ids = set()
-                for record in results:
-                    source_node, rel, target_node = record['m'], record['r'], record['n']
-                    source_id = source_node.element_id
-                    source_label = list(source_node.labels)[0]
-                    source_name = source_node._properties.get('name', 'N/A')
-                    target_id = target_node.element_id
-                    target_label = list(target_node.labels)[0]
-                    target_name = target_node._properties.get('name', 'N/A')
-                    if source_id not in node_ids:
-                        nodes.append(Node(id=source_id, label=source_name, shape="dot", size=28, font={"size": 22}, color="#FF9900", title=source_label))
-                        node_ids.add(source_id)
-                    if target_id not in node_ids:
-                        color_map = {"Condition": "#ffb3c6", "SideEffect": "#b3d9ff", "ActiveIngredient": "#baf5ba", "Manufacturer": "#ffe1a8"}
-                        nodes.append(Node(id=target_id, label=target_name, shape="box", color=color_map.get(target_label, "#E0E0E0"), title=target_label))
-                        node_ids.add(target_id)
-                    rel_type = rel.type.replace("_", " ").title()
-                    edges.append(Edge(source=source_id, target=target_id, label=rel_type))
-                config = Config(width=1100, height=700, directed=True, physics=True, hierarchical=False, nodeHighlightBehavior=True, highlightColor="#F7A7A6")
-                agraph(nodes=nodes, edges=edges, config=config)
+            subgraph = engine.get_graph_for_visualization(resolve_medicine_input(vis_medicine))
+            if subgraph:
+                if not expand_graph:
+                    st.session_state["vis_nodes"] = {}
+                    st.session_state["vis_edges"] = {}
+                graph_nodes = st.session_state["vis_nodes"]
+                graph_edges = st.session_state["vis_edges"]
+                center = subgraph[0]
+                # Neighbours arrive distinct from Cypher; colouring and edge labels
+                # are vectorized, then one pass builds the agraph objects.
+                neighbors = pd.DataFrame(center['neighbors'], columns=["id", "name", "label"])
+                neighbors["color"] = neighbors["label"].map(VIS_COLOR_MAP).fillna("#E0E0E0")
+                rels = pd.DataFrame(center['rels'], columns=["target", "rel"])
+                rels["rel_label"] = rels["rel"].map(REL_LABELS).fillna(rels["rel"].str.replace("_", " ").str.title())
+                new_neighbors = neighbors[~neighbors["id"].isin(graph_nodes.keys()) & (neighbors["id"] != center['id'])]
+                if center['id'] not in graph_nodes:
+                    graph_nodes[center['id']] = Node(id=center['id'], label=center['name'], shape="dot", size=28, font={"size": 22}, color="#FF9900", title=center['label'])
+                graph_nodes.update(
+                    (node_id, Node(id=node_id, label=name, shape="box", color=color, title=label))
+                    for node_id, name, label, color in zip(new_neighbors["id"], new_neighbors["name"], new_neighbors["label"], new_neighbors["color"])
+                )
+                for target, rel_label in zip(rels["target"], rels["rel_label"]):
+                    graph_edges.setdefault((center['id'], target, rel_label), Edge(source=center['id'], target=target, label=rel_label))
             else:
                 st.warning("No graph data available for that medicine.")
 
+    if st.session_state["vis_nodes"]:
+        config = Config(width=1100, height=700, directed=True, physics=True, hierarchical=False, nodeHighlightBehavior=True, highlightColor="#F7A7A6")
+        # Cap the layout simulation instead of running vis.js' default 1000 iterations
+        config.physics["stabilization"]["iterations"] = 50
+        agraph(nodes=list(st.session_state["vis_nodes"].values()), edges=list(st.session_state["vis_edges"].values()), config=config)
+
 with tab7:
     st.header("🔧 Image Debug Tool")
     st.write("Investigate how image URLs are being resolved & rendered.")
@@ -323,7 +401,7 @@ with tab7:
             med_card = _cache_med_card(debug_med)
             if med_card:
                 st.subheader("Record JSON")
-                st.json(med_card)
+                render_json(med_card)
                 url = med_card.get('image_url')
                 st.markdown(f"**Raw URL:** `{url}`")
                 safe = sanitize_image_url(url)
@@ -334,9 +412,10 @@ with tab7:
     st.subheader("Quick Sample Tests")
     sample_meds = ["Avastin 400mg Injection", "Augmentin 625 Duo Tablet", "Azithral 500 Tablet"]
     cols_dbg = st.columns(len(sample_meds))
+    sample_cards = _cache_med_cards(tuple(sample_meds))
     for i, med in enumerate(sample_meds):
         with cols_dbg[i]:
-            med_card = _cache_med_card(med)
+            med_card = sample_cards.get(med)
             display_medicine_image(med_card.get('image_url') if med_card else None, med)
             if med_card:
                 st.caption("OK" if sanitize_image_url(med_card.get('image_url')) else "No URL")